@@ -0,0 +1,124 @@
+import numpy as np
+
+from edges import as_edge_list, flat
+
+# Local search stops when a pass over all vertices gains less than this share of the current weight
+EPSILON = 0.001
+
+# Local search never does more passes than this
+MAX_PASSES = 20
+
+
+# Upper bound on the weight of any matching: every vertex pays half of its heaviest edge,
+# so the two ends of an edge always pay at least its weight
+def vertex_bound(graph):
+    heaviest = np.zeros(graph.size, dtype=graph.weight.dtype)
+    np.maximum.at(heaviest, graph.src, graph.weight)
+    np.maximum.at(heaviest, graph.dst, graph.weight)
+    return heaviest.sum().item() / 2
+
+
+# Approximate maximum weight matching for pools that are too big for blossom_algorithm
+# Starts from the greedy matching over the positive edges and then improves it with the best augmentation of
+# length at most 3 centered at every vertex or matched edge: a new edge at one or both ends of a matched edge,
+# each new edge taking its other end away from its old partner
+# epsilon is the quality knob: smaller values do more passes and get closer to the optimum
+# Unlike blossom_algorithm it maximises only the weight, not the number of pairs first
+# If stats is a dict, the weight, an upper bound of the optimum, their ratio and the number of passes are written to it
+def approximate_matching(edges, epsilon=EPSILON, stats=None):
+    graph = as_edge_list(edges)
+    nvertex = graph.size
+    # Flat array.array copies of the edge arrays, see blossom_algorithm
+    edgesrc = flat(graph.src)
+    edgedst = flat(graph.dst)
+    edgeweight = flat(graph.weight)
+    neighbstart, neighbend = (flat(array) for array in graph.adjacency())
+    # matched[v] is the edge that covers v or -1, lost[v] is the weight lost when v leaves it
+    matched = nvertex * [-1]
+    lost = nvertex * [0]
+
+    def match(k):
+        for v in (edgesrc[k], edgedst[k]):
+            old = matched[v]
+            if old != -1:
+                for u in (edgesrc[old], edgedst[old]):
+                    matched[u] = -1
+                    lost[u] = 0
+        for v in (edgesrc[k], edgedst[k]):
+            matched[v] = k
+            lost[v] = edgeweight[k]
+
+    # The two best new edges at v, as (gain, edge, other end), that do not go to the vertex partner
+    def best_edges(v, partner):
+        first = second = (0, -1, -1)
+        for p in neighbend[neighbstart[v]:neighbstart[v + 1]]:
+            k = p >> 1
+            u = edgedst[k] if p & 1 else edgesrc[k]
+            if u == v or u == partner:
+                continue
+            gain = edgeweight[k] - lost[u]
+            if gain > second[0]:
+                if gain > first[0]:
+                    first, second = (gain, k, u), first
+                else:
+                    second = (gain, k, u)
+        return first, second
+
+    weight = 0
+    for k in flat(np.argsort(-graph.weight, kind='stable')):
+        if edgeweight[k] <= 0:
+            break
+        if matched[edgesrc[k]] == -1 and matched[edgedst[k]] == -1 and edgesrc[k] != edgedst[k]:
+            match(k)
+            weight += edgeweight[k]
+    upper_bound = min(2 * weight, vertex_bound(graph))
+
+    passes = 0
+    while passes < MAX_PASSES:
+        passes += 1
+        improved = 0
+        for a in range(nvertex):
+            k = matched[a]
+            if k == -1:
+                gain, new, u = best_edges(a, -1)[0]
+                if gain > 0:
+                    match(new)
+                    improved += gain
+                continue
+            b = edgedst[k] if edgesrc[k] == a else edgesrc[k]
+            if b < a:
+                continue
+            # Best of: one new edge at a, one at b, or one at each end, the matched edge (a, b) is dropped
+            best, moves = 0, ()
+            options_a = best_edges(a, b)
+            options_b = best_edges(b, a)
+            for gain, new, u in options_a + options_b:
+                if new != -1 and gain - edgeweight[k] > best:
+                    best, moves = gain - edgeweight[k], (new,)
+            for gain_a, new_a, x in options_a:
+                for gain_b, new_b, y in options_b:
+                    if new_a == -1 or new_b == -1 or x == y:
+                        continue
+                    gain = gain_a + gain_b - edgeweight[k]
+                    # x and y were matched to each other, that edge was counted as lost twice
+                    if matched[x] != -1 and matched[x] == matched[y]:
+                        gain += edgeweight[matched[x]]
+                    if gain > best:
+                        best, moves = gain, (new_a, new_b)
+            if moves:
+                for new in moves:
+                    match(new)
+                improved += best
+        weight += improved
+        if improved <= epsilon * weight:
+            break
+
+    pairs = []
+    for v in range(nvertex):
+        k = matched[v]
+        if k != -1 and v == min(edgesrc[k], edgedst[k]):
+            pairs.append((v, max(edgesrc[k], edgedst[k])))
+    if stats is not None:
+        stats.update(weight=weight, upper_bound=upper_bound, ratio=weight / upper_bound if upper_bound else 1.0,
+                     passes=passes)
+    return pairs, weight
@@ -0,0 +1,148 @@
+import json
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import graph_builder
+import matching
+from blossom import blossom_algorithm
+from config import MATCHING_DEADLINE, SOLVER_OPTIONS
+from edges import EdgeList
+from matching import greedy
+from repository import Document
+from synthetic import WEEKS, random_profile, synthetic_repository
+
+# Share of the users that change their profile between two runs
+CHANGED_SHARE = 0.05
+
+# Pool sizes and stages of the scaling benchmark
+SCALING_USERS = [1000, 5000, 20000, 50000]
+STAGES = ('read', 'build_graph', 'create_new_pairs', 'write')
+
+
+def solve(graph, init_matching=None, init_duals=None):
+    stats = dict()
+    start = time.perf_counter()
+    pairs, weight = blossom_algorithm(graph, init_matching, init_duals, stats)
+    stats['time'] = time.perf_counter() - start
+    stats['weight'] = weight
+    return pairs, stats
+
+
+# Compares the stages of a cold start with the warm starts from the greedy matching
+# and from the pairs and duals of the run before a few users or edges changed
+def compare_warm_starts(name, previous_graph, graph):
+    previous_pairs, previous = solve(previous_graph)
+    results = {
+        'cold': solve(graph)[1],
+        'greedy': solve(graph, greedy(graph)[0])[1],
+        'previous run': solve(graph, previous_pairs, previous['duals'])[1],
+    }
+    print(f"{name}: {graph.size} vertices, {len(graph)} edges")
+    for start, stats in results.items():
+        print(f"{start:>14}: {stats['stages']:5} stages, {stats['warm_pairs']:5} pairs kept, "
+              f"{stats['time']:7.3f}s, weight {stats['weight']}")
+    return results
+
+
+# Graph of n users with random profiles, before and after CHANGED_SHARE of them edit their profile
+def profile_graphs(n):
+    profiles = [random_profile() for _ in range(n)]
+    previous_graph, _ = graph_builder.build_graph([Document(str(i), data) for i, data in enumerate(profiles)], [])
+    for i in random.sample(range(n), int(n * CHANGED_SHARE)):
+        profiles[i] = random_profile()
+    graph, _ = graph_builder.build_graph([Document(str(i), data) for i, data in enumerate(profiles)], [])
+    return previous_graph, graph
+
+
+# Random graph with weights 1..100, before and after CHANGED_SHARE of the edges get a new weight
+def random_graphs(n, density=0.1):
+    edges = [[i, j, random.randint(1, 100)] for i in range(n) for j in range(i + 1, n) if random.random() < density]
+    changed = [[i, j, random.randint(1, 100) if random.random() < CHANGED_SHARE else w] for i, j, w in edges]
+    return EdgeList.from_lists(edges, n), EdgeList.from_lists(changed, n)
+
+
+# Runs function(*args) and returns its result with the seconds it took and max_rss_mib,
+# the largest resident memory of the process so far, so the stage that raised it is the one that needs it
+# With trace the peak of the python memory the stage allocated is measured by tracemalloc as well,
+# which makes the stages several times slower
+def measure(function, *args, trace=False, **kwargs):
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    stage = {'seconds': time.perf_counter() - start,
+             'max_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10}
+    if trace:
+        stage['peak_mib'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result, stage
+
+
+# The stages of make_pairs on a synthetic pool of n users with weeks of history: reading the repository,
+# build_graph, create_new_pairs and the write of the pairs
+# The matching runs with the deadline and the solver options of make_pairs, solver_max_rss_mib is the largest
+# resident memory of the solver processes (0 if the solver ran in this process),
+# latency is the seconds every request of the repository waits, to see the cost of the writes
+# density is the share of the ordered pairs of active users that have an edge, both directions of a pair are edges
+def scaling_run(n, weeks=WEEKS, seed=0, latency=0, trace=False, deadline=MATCHING_DEADLINE):
+    repository = synthetic_repository(n, weeks, seed, latency)
+    result = {'users': n, 'weeks': weeks, 'seed': seed, 'latency': latency, 'deadline': deadline}
+    (users, history), result['read'] = measure(lambda: (repository.get_users(), repository.get_history()),
+                                               trace=trace)
+    (graph, users_ind), result['build_graph'] = measure(graph_builder.build_graph, users, history, trace=trace)
+    stats = dict()
+    pairs, result['create_new_pairs'] = measure(matching.create_new_pairs, graph, stats=stats, deadline=deadline,
+                                                solver_options=SOLVER_OPTIONS, trace=trace)
+    result['create_new_pairs']['solver_max_rss_mib'] = \
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 2 ** 10
+    requests = repository.requests
+    _, result['write'] = measure(repository.update, [(users_ind[i], users_ind[j]) for i, j in pairs], stats,
+                                 trace=trace)
+    result['write']['requests'] = repository.requests - requests
+    active = len(users_ind)
+    result.update(active=active, edges=len(graph), density=len(graph) / max(active * (active - 1), 1),
+                  pairs=len(pairs), solver=stats['solver'], missed_deadline=stats['missed_deadline'],
+                  weight=stats['weight'], upper_bound=stats['upper_bound'])
+    return result
+
+
+# Runs scaling_run for every pool size and writes the results as JSON to path, so runs can be compared
+# Every size runs in a new process, so the memory of one size does not show up in the next one
+def scaling_benchmark(path, sizes=SCALING_USERS, weeks=WEEKS, seed=0, latency=0, trace=False,
+                      deadline=MATCHING_DEADLINE):
+    report = {
+        'started': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'trace': trace,
+        'runs': [],
+    }
+    for n in sizes:
+        with ProcessPoolExecutor(1) as executor:
+            result = executor.submit(scaling_run, n, weeks, seed, latency, trace, deadline).result()
+        report['runs'].append(result)
+        print(f"{n} users, {result['edges']} edges ({result['density']:.2%}), {result['solver']}: " +
+              ", ".join(f"{stage} {result[stage]['seconds']:.2f}s" for stage in STAGES) +
+              f", {result[STAGES[-1]]['max_rss_mib']:.0f}MiB")
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=2)
+    return report
+
+
+# python benchmark.py [n ...] compares the warm starts,
+# python benchmark.py scaling results.json [n ...] runs the scaling benchmark, with trace instead of scaling
+# the stages are traced by tracemalloc as well
+if __name__ == "__main__":
+    random.seed(0)
+    if sys.argv[1:2] in (['scaling'], ['trace']):
+        scaling_benchmark(sys.argv[2], list(map(int, sys.argv[3:])) or SCALING_USERS, trace=sys.argv[1] == 'trace')
+        sys.exit()
+    for n in map(int, sys.argv[1:] or ['200', '500']):
+        compare_warm_starts('profiles', *profile_graphs(n))
+        compare_warm_starts('random weights', *random_graphs(n))
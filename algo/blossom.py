@@ -1,22 +1,40 @@
+from heapq import heappop, heappush
 
+import numpy as np
 
-def blossom_algorithm(edges):
-    if not edges:
-        return []
-    nedge = len(edges)
-    nvertex = 0
-    for (i, j, w) in edges:
-        if i >= nvertex:
-            nvertex = i + 1
-        if j >= nvertex:
-            nvertex = j + 1
-    maxweight = max(0, max([wt for (i, j, wt) in edges]))
-    endpoint = [edges[p // 2][p % 2] for p in range(2 * nedge)]
-    neighbend = [[] for i in range(nvertex)]
-    for k in range(len(edges)):
-        (i, j, w) = edges[k]
-        neighbend[i].append(2 * k + 1)
-        neighbend[j].append(2 * k)
+from edges import EdgeList, as_edge_list, flat
+
+# How many matched pairs deep a dual change is pushed when the warm start repairs its input
+PUSH_DEPTH = 3
+
+
+# edges is an EdgeList or a list of [i, j, w]
+# The per-edge arrays are copied once into flat array.array buffers, 8 bytes per item like the EdgeList itself,
+# and the per-edge flags into a bytearray, so memory stays linear in bytes and not in python objects
+# The state of vertices and blossoms is kept in flat lists indexed by vertex (0..n-1) or blossom (n..2n-1),
+# every blossom keeps the list of its leaves and nothing recurses, so deeply nested blossoms are fine
+# Dual changes are not applied to every vertex: a labeled top-level blossom remembers the total delta of the stage
+# when it got its label and its duals are brought up to date only when that label or the blossom changes.
+# The candidates for the next delta are kept in heaps with lazy deletion, so a dual update costs only the work it does
+# init_matching is an optional list of pairs (i, j) to start from, for example greedy pairs or last week's pairs
+# init_duals is an optional list with a dual per vertex, for example stats['duals'] of an earlier run
+# Both are repaired if needed, so any input gives the same optimum, a good one just needs fewer stages
+# If stats is a dict, the number of stages, the pairs kept from the warm start, whether it had to start over
+# and the final duals are written to it
+def blossom_algorithm(edges, init_matching=None, init_duals=None, stats=None):
+    if not len(edges):
+        if stats is not None:
+            stats.update(stages=0, warm_pairs=0, restarted=False, duals=[])
+        return [], 0
+    graph = as_edge_list(edges)
+    nedge = len(graph)
+    nvertex = graph.size
+    edgesrc = flat(graph.src)
+    edgedst = flat(graph.dst)
+    twiceweight = flat(2 * graph.weight)
+    maxweight = max(0, graph.weight.max().item())
+    endpoint = flat(graph.endpoints())
+    neighbstart, neighbend = (flat(array) for array in graph.adjacency())
     mate = nvertex * [-1]
     label = (2 * nvertex) * [0]
     labelend = (2 * nvertex) * [-1]
@@ -24,37 +42,113 @@ def blossom_algorithm(edges):
     blossomparent = (2 * nvertex) * [-1]
     blossomchilds = (2 * nvertex) * [None]
     blossombase = list(range(nvertex)) + nvertex * [-1]
+    blossomleaves = [[v] for v in range(nvertex)] + nvertex * [None]
     blossomendps = (2 * nvertex) * [None]
     bestedge = (2 * nvertex) * [-1]
     blossombestedges = (2 * nvertex) * [None]
     unusedblossoms = list(range(nvertex, 2 * nvertex))
     dualvar = nvertex * [maxweight] + nvertex * [0]
-    allowedge = nedge * [False]
+    allowedge = bytearray(nedge)
     queue = []
+    # Sum of the deltas in the current stage, and its value when each top-level blossom got its label
+    total = 0
+    stamp = (2 * nvertex) * [0]
+    # Blossoms that got a label in this stage, the ones still on top are settled at its end
+    labeled = []
+    # Candidates for the delta as (key, ...), where the key does not change while the entry is valid:
+    # slack + total for edges from S to free vertices, slack + 2 * total for edges between S-blossoms
+    # and dual + total for T-blossoms. bestkey[x] is the key of bestedge[x] while x is free or an S-blossom
+    bestkey = (2 * nvertex) * [0]
+    freeedges = []
+    sedges = []
+    tblossoms = []
 
+    # Current dual of the vertex v
+    def dual(v):
+        b = inblossom[v]
+        if label[b] == 1:
+            return dualvar[v] - total + stamp[b]
+        if label[b] == 2:
+            return dualvar[v] + total - stamp[b]
+        return dualvar[v]
+
+    # Same as dual(i) + dual(j) - twiceweight[k], written out because it is called for most scanned edges
     def slack(k):
-        (i, j, wt) = edges[k]
-        return dualvar[i] + dualvar[j] - 2 * wt
-
-    def blossom_leaves(b):
-        if b < nvertex:
-            yield b
-        else:
-            for t in blossomchilds[b]:
-                if t < nvertex:
-                    yield t
-                else:
-                    for v in blossom_leaves(t):
-                        yield v
+        i = edgesrc[k]
+        j = edgedst[k]
+        kslack = dualvar[i] + dualvar[j] - twiceweight[k]
+        b = inblossom[i]
+        if label[b] == 1:
+            kslack += stamp[b] - total
+        elif label[b] == 2:
+            kslack += total - stamp[b]
+        b = inblossom[j]
+        if label[b] == 1:
+            kslack += stamp[b] - total
+        elif label[b] == 2:
+            kslack += total - stamp[b]
+        return kslack
+
+    # Writes the pending dual change of the top-level blossom b to its leaves and to b itself
+    def settle(b):
+        if label[b] == 1 or label[b] == 2:
+            d = total - stamp[b] if label[b] == 1 else stamp[b] - total
+            if d:
+                for v in blossomleaves[b]:
+                    dualvar[v] -= d
+                if b >= nvertex:
+                    dualvar[b] += d
+        stamp[b] = total
+
+    # The valid entry with the smallest key, entries whose key changed are put back with the new key
+    def heap_top(heap, current):
+        while heap:
+            entry = heap[0]
+            key = current(entry)
+            if key == entry[0]:
+                return entry
+            heappop(heap)
+            if key is not None:
+                heappush(heap, (key,) + entry[1:])
+        return None
+
+    def free_key(entry):
+        key, k, v = entry
+        if label[inblossom[v]] != 0 or bestedge[v] != k:
+            return None
+        return bestkey[v]
+
+    def sedge_key(entry):
+        key, k, b = entry
+        if blossomparent[b] != -1 or label[b] != 1 or bestedge[b] != k:
+            return None
+        return bestkey[b]
+
+    def tblossom_key(entry):
+        key, b = entry
+        if blossombase[b] < 0 or blossomparent[b] != -1 or label[b] != 2:
+            return None
+        return dualvar[b] + stamp[b]
+
+    # Leaves in the order of the children, the children have to be up to date
+    def collect_leaves(b):
+        leaves = []
+        for t in blossomchilds[b]:
+            leaves.extend(blossomleaves[t])
+        blossomleaves[b] = leaves
 
     def assign_label(w, t, p):
         b = inblossom[w]
         label[w] = label[b] = t
         labelend[w] = labelend[b] = p
         bestedge[w] = bestedge[b] = -1
+        stamp[b] = total
+        labeled.append(b)
         if t == 1:
-            queue.extend(blossom_leaves(b))
+            queue.extend(blossomleaves[b])
         elif t == 2:
+            if b >= nvertex:
+                heappush(tblossoms, (dualvar[b] + total, b))
             base = blossombase[b]
             assign_label(endpoint[mate[base]], 1, mate[base] ^ 1)
 
@@ -81,7 +175,8 @@ def blossom_algorithm(edges):
         return base
 
     def add_blossom(base, k):
-        (v, w, wt) = edges[k]
+        v = edgesrc[k]
+        w = edgedst[k]
         bb = inblossom[base]
         bv = inblossom[v]
         bw = inblossom[w]
@@ -107,49 +202,87 @@ def blossom_algorithm(edges):
             endps.append(labelend[bw] ^ 1)
             w = endpoint[labelend[bw]]
             bw = inblossom[w]
+        for bv in path:
+            settle(bv)
         label[b] = 1
         labelend[b] = labelend[bb]
         dualvar[b] = 0
-        for v in blossom_leaves(b):
+        stamp[b] = total
+        labeled.append(b)
+        collect_leaves(b)
+        for v in blossomleaves[b]:
             if label[inblossom[v]] == 2:
                 queue.append(v)
             inblossom[v] = b
-        bestedgeto = (2 * nvertex) * [-1]
+        bestedgeto = dict()
         for bv in path:
             if blossombestedges[bv] is None:
-                nblists = [[p // 2 for p in neighbend[v]]
-                           for v in blossom_leaves(bv)]
+                nblists = [[p // 2 for p in neighbend[neighbstart[v]:neighbstart[v + 1]]]
+                           for v in blossomleaves[bv]]
             else:
                 nblists = [blossombestedges[bv]]
             for nblist in nblists:
                 for k in nblist:
-                    (i, j, wt) = edges[k]
+                    i = edgesrc[k]
+                    j = edgedst[k]
                     if inblossom[j] == b:
                         i, j = j, i
                     bj = inblossom[j]
                     if (bj != b and label[bj] == 1 and
-                            (bestedgeto[bj] == -1 or
+                            (bj not in bestedgeto or
                              slack(k) < slack(bestedgeto[bj]))):
                         bestedgeto[bj] = k
             blossombestedges[bv] = None
             bestedge[bv] = -1
-        blossombestedges[b] = [k for k in bestedgeto if k != -1]
+        blossombestedges[b] = list(bestedgeto.values())
         bestedge[b] = -1
         for k in blossombestedges[b]:
             if bestedge[b] == -1 or slack(k) < slack(bestedge[b]):
                 bestedge[b] = k
+        if bestedge[b] != -1:
+            bestkey[b] = slack(bestedge[b]) + 2 * total
+            heappush(sedges, (bestkey[b], bestedge[b], b))
+
+    def release_blossom(b):
+        label[b] = labelend[b] = -1
+        blossomchilds[b] = blossomendps[b] = blossomleaves[b] = None
+        blossombase[b] = -1
+        blossombestedges[b] = None
+        bestedge[b] = -1
+        unusedblossoms.append(b)
 
-    def expand_blossom(b, endstage):
+    # At the end of a stage the sub-blossoms with zero dual are expanded too,
+    # the stack keeps the (blossom, next child) frames so they are released children first
+    def expand_blossom_endstage(b):
+        stack = [(b, 0)]
+        while stack:
+            b, i = stack.pop()
+            childs = blossomchilds[b]
+            while i < len(childs):
+                s = childs[i]
+                i += 1
+                blossomparent[s] = -1
+                if s < nvertex:
+                    inblossom[s] = s
+                elif dualvar[s] == 0:
+                    stack.append((b, i))
+                    stack.append((s, 0))
+                    break
+                else:
+                    for v in blossomleaves[s]:
+                        inblossom[v] = s
+            else:
+                release_blossom(b)
+
+    def expand_blossom(b):
+        settle(b)
         for s in blossomchilds[b]:
             blossomparent[s] = -1
-            if s < nvertex:
-                inblossom[s] = s
-            elif endstage and dualvar[s] == 0:
-                expand_blossom(s, endstage)
-            else:
-                for v in blossom_leaves(s):
-                    inblossom[v] = s
-        if (not endstage) and label[b] == 2:
+            stamp[s] = total
+            labeled.append(s)
+            for v in blossomleaves[s]:
+                inblossom[v] = s
+        if label[b] == 2:
             entrychild = inblossom[endpoint[labelend[b] ^ 1]]
             j = blossomchilds[b].index(entrychild)
             if j & 1:
@@ -173,13 +306,16 @@ def blossom_algorithm(edges):
             label[endpoint[p ^ 1]] = label[bv] = 2
             labelend[endpoint[p ^ 1]] = labelend[bv] = p
             bestedge[bv] = -1
+            labeled.append(bv)
+            if bv >= nvertex:
+                heappush(tblossoms, (dualvar[bv] + total, bv))
             j += jstep
             while blossomchilds[b][j] != entrychild:
                 bv = blossomchilds[b][j]
                 if label[bv] == 1:
                     j += jstep
                     continue
-                for v in blossom_leaves(bv):
+                for v in blossomleaves[bv]:
                     if label[v] != 0:
                         break
                 if label[v] != 0:
@@ -187,45 +323,67 @@ def blossom_algorithm(edges):
                     label[endpoint[mate[blossombase[bv]]]] = 0
                     assign_label(v, 2, labelend[v])
                 j += jstep
-        label[b] = labelend[b] = -1
-        blossomchilds[b] = blossomendps[b] = None
-        blossombase[b] = -1
-        blossombestedges[b] = None
-        bestedge[b] = -1
-        unusedblossoms.append(b)
+        # Leaves that are free now compete for delta 2 again with the edges they saw while inside b
+        for s in blossomchilds[b]:
+            if label[s] == 0:
+                for v in blossomleaves[s]:
+                    if bestedge[v] != -1:
+                        bestkey[v] = slack(bestedge[v]) + total
+                        heappush(freeedges, (bestkey[v], bestedge[v], v))
+        release_blossom(b)
 
+    # Moves the base of b to the leaf v, swapping the matched and unmatched edges on the way
+    # The sub-blossoms are handled through a stack of tasks in the same order a recursive version would:
+    # (b, v) augments b to v, (-1, p) matches the edge of endpoint p, (-2, b, i) rotates the children of b
     def augment_blossom(b, v):
-        t = v
-        while blossomparent[t] != b:
-            t = blossomparent[t]
-        if t >= nvertex:
-            augment_blossom(t, v)
-        i = j = blossomchilds[b].index(t)
-        if i & 1:
-            j -= len(blossomchilds[b])
-            jstep = 1
-            endptrick = 0
-        else:
-            jstep = -1
-            endptrick = 1
-        while j != 0:
-            j += jstep
-            t = blossomchilds[b][j]
-            p = blossomendps[b][j - endptrick] ^ endptrick
-            if t >= nvertex:
-                augment_blossom(t, endpoint[p])
-            j += jstep
-            t = blossomchilds[b][j]
+        tasks = [(b, v)]
+        while tasks:
+            task = tasks.pop()
+            if task[0] == -1:
+                p = task[1]
+                mate[endpoint[p]] = p ^ 1
+                mate[endpoint[p ^ 1]] = p
+                continue
+            if task[0] == -2:
+                b, i = task[1], task[2]
+                blossomchilds[b] = blossomchilds[b][i:] + blossomchilds[b][:i]
+                blossomendps[b] = blossomendps[b][i:] + blossomendps[b][:i]
+                blossombase[b] = blossombase[blossomchilds[b][0]]
+                collect_leaves(b)
+                continue
+            b, v = task
+            t = v
+            while blossomparent[t] != b:
+                t = blossomparent[t]
+            steps = []
             if t >= nvertex:
-                augment_blossom(t, endpoint[p ^ 1])
-            mate[endpoint[p]] = p ^ 1
-            mate[endpoint[p ^ 1]] = p
-        blossomchilds[b] = blossomchilds[b][i:] + blossomchilds[b][:i]
-        blossomendps[b] = blossomendps[b][i:] + blossomendps[b][:i]
-        blossombase[b] = blossombase[blossomchilds[b][0]]
+                steps.append((t, v))
+            i = j = blossomchilds[b].index(t)
+            if i & 1:
+                j -= len(blossomchilds[b])
+                jstep = 1
+                endptrick = 0
+            else:
+                jstep = -1
+                endptrick = 1
+            while j != 0:
+                j += jstep
+                t = blossomchilds[b][j]
+                p = blossomendps[b][j - endptrick] ^ endptrick
+                if t >= nvertex:
+                    steps.append((t, endpoint[p]))
+                j += jstep
+                t = blossomchilds[b][j]
+                if t >= nvertex:
+                    steps.append((t, endpoint[p ^ 1]))
+                steps.append((-1, p))
+            steps.append((-2, b, i))
+            steps.reverse()
+            tasks.extend(steps)
 
     def augment_matching(k):
-        (v, w, wt) = edges[k]
+        v = edgesrc[k]
+        w = edgedst[k]
         for (s, p) in ((v, 2 * k + 1), (w, 2 * k)):
             while 1:
                 bs = inblossom[s]
@@ -243,12 +401,154 @@ def blossom_algorithm(edges):
                 mate[j] = labelend[bt]
                 p = labelend[bt] ^ 1
 
+    def unmatch(v):
+        mate[endpoint[mate[v]]] = -1
+        mate[v] = -1
+
+    def half(x):
+        return x // 2 if isinstance(x, int) else x / 2
+
+    def neighbours(v):
+        return neighbend[neighbstart[v]:neighbstart[v + 1]]
+
+    # Lowers the dual of v by amount. A matched neighbour whose edge would get a negative slack is raised,
+    # and its partner lowered in turn, at most depth levels deep and never below floor.
+    # Changes nothing and returns False if that fails
+    def lower(v, amount, floor=None, depth=PUSH_DEPTH):
+        changes = []
+        pending = [(v, amount, depth)]
+        while pending:
+            v, amount, depth = pending.pop()
+            changes.append((v, dualvar[v]))
+            dualvar[v] -= amount
+            failed = floor is not None and dualvar[v] < floor
+            for p in neighbours(v):
+                w = endpoint[p]
+                kslack = slack(p // 2)
+                if failed or kslack >= 0 or w == v:
+                    continue
+                if mate[w] == -1 or depth == 0:
+                    failed = True
+                    continue
+                changes.append((w, dualvar[w]))
+                dualvar[w] -= kslack
+                pending.append((endpoint[mate[w]], -kslack, depth - 1))
+            if failed:
+                for w, dual in reversed(changes):
+                    dualvar[w] = dual
+                return False
+        return True
+
+    # Smallest dual of v that keeps its edges to matched vertices feasible, None if it has no such edges
+    def lowest_dual(v):
+        need = None
+        for p in neighbours(v):
+            w = endpoint[p]
+            if mate[w] != -1 and (need is None or twiceweight[p // 2] - dualvar[w] > need):
+                need = twiceweight[p // 2] - dualvar[w]
+        return need
+
+    # Turns the initial matching and duals into a valid starting point of a stage:
+    # every slack is >= 0 and matched edges are tight. Pairs that can not be kept that way are unmatched
+    def warm_start():
+        edgeof = dict()
+        for k in range(nedge):
+            i = edgesrc[k]
+            j = edgedst[k]
+            if i != j:
+                key = (min(i, j), max(i, j))
+                if key not in edgeof or twiceweight[k] > twiceweight[edgeof[key]]:
+                    edgeof[key] = k
+        for i, j in init_matching or ():
+            k = edgeof.get((min(i, j), max(i, j)))
+            if k is not None and mate[i] == -1 and mate[j] == -1:
+                mate[edgesrc[k]] = 2 * k + 1
+                mate[edgedst[k]] = 2 * k
+        if init_duals is not None:
+            dualvar[:nvertex] = np.asarray(init_duals, dtype=graph.weight.dtype).tolist()
+        elif init_matching is not None:
+            for v in range(nvertex):
+                dualvar[v] = half(twiceweight[mate[v] // 2]) if mate[v] != -1 else 0
+        # A matched edge that is not tight is made tight by lowering the dual of one of its ends
+        for v in range(nvertex):
+            if mate[v] == -1:
+                continue
+            u = endpoint[mate[v]]
+            kslack = slack(mate[v] // 2)
+            if kslack < 0:
+                dualvar[v] -= kslack
+            elif kslack > 0 and not lower(v, kslack) and not lower(u, kslack):
+                unmatch(v)
+        # A violated edge is fixed by raising the dual of a free end, or of a matched end whose partner
+        # can give the same amount away. Raising a dual only makes slacks bigger, so one pass is enough
+        for k in range(nedge):
+            i = edgesrc[k]
+            j = edgedst[k]
+            kslack = slack(k)
+            if i == j or kslack >= 0:
+                continue
+            if mate[i] != -1 and mate[j] != -1:
+                for v in (i, j):
+                    dualvar[v] -= kslack
+                    if lower(endpoint[mate[v]], -kslack):
+                        break
+                    dualvar[v] += kslack
+                else:
+                    unmatch(i)
+                    dualvar[i] -= kslack
+            elif mate[i] == -1:
+                dualvar[i] -= kslack
+            else:
+                dualvar[j] -= kslack
+        # An edge between free vertices would push the common dual of free vertices up to its weight,
+        # so free vertices are matched greedily first, splitting the weight so that their other edges stay feasible
+        for k in sorted(range(nedge), key=lambda k: -twiceweight[k]):
+            i = edgesrc[k]
+            j = edgedst[k]
+            if i == j or mate[i] != -1 or mate[j] != -1:
+                continue
+            needi = lowest_dual(i)
+            needj = lowest_dual(j)
+            if needi is not None and needj is not None and needi + needj > twiceweight[k]:
+                continue
+            if needi is not None:
+                dualvar[i] = needi
+            elif needj is not None:
+                dualvar[i] = twiceweight[k] - needj
+            else:
+                dualvar[i] = half(twiceweight[k])
+            dualvar[j] = twiceweight[k] - dualvar[i]
+            mate[i] = 2 * k + 1 if edgesrc[k] == i else 2 * k
+            mate[j] = mate[i] ^ 1
+        # Free vertices go as low as their edges allow, a lower dual only makes the final check easier.
+        # With integer weights they all get the same parity, so slacks between trees stay even
+        for v in range(nvertex):
+            if mate[v] != -1:
+                continue
+            need = None
+            for p in neighbours(v):
+                w = endpoint[p]
+                bound = half(twiceweight[p // 2]) if mate[w] == -1 else twiceweight[p // 2] - dualvar[w]
+                if need is None or bound > need:
+                    need = bound
+            if need is not None:
+                dualvar[v] = need + need % 2 if isinstance(need, int) else need
+
+    stages = 0
+    warm = init_matching is not None or init_duals is not None
+    if warm:
+        warm_start()
+    warmpairs = sum(1 for v in range(nvertex) if mate[v] != -1) // 2
+
     for t in range(nvertex):
+        stages += 1
         label[:] = (2 * nvertex) * [0]
         bestedge[:] = (2 * nvertex) * [-1]
         blossombestedges[nvertex:] = nvertex * [None]
-        allowedge[:] = nedge * [False]
+        allowedge[:] = bytes(nedge)
         queue[:] = []
+        freeedges[:] = sedges[:] = tblossoms[:] = labeled[:] = []
+        total = 0
         for v in range(nvertex):
             if mate[v] == -1 and label[inblossom[v]] == 0:
                 assign_label(v, 1, -1)
@@ -257,13 +557,20 @@ def blossom_algorithm(edges):
         while 1:
             while queue and not augmented:
                 v = queue.pop()
-                for p in neighbend[v]:
+                # v is an S-vertex, its dual does not change during the scan
+                dv = dual(v)
+                for p in neighbend[neighbstart[v]:neighbstart[v + 1]]:
                     k = p // 2
                     w = endpoint[p]
-                    if inblossom[v] == inblossom[w]:
+                    bw = inblossom[w]
+                    if inblossom[v] == bw:
                         continue
                     if not allowedge[k]:
-                        kslack = slack(k)
+                        kslack = dv + dualvar[w] - twiceweight[k]
+                        if label[bw] == 1:
+                            kslack += stamp[bw] - total
+                        elif label[bw] == 2:
+                            kslack += total - stamp[bw]
                         if kslack <= 0:
                             allowedge[k] = True
                     if allowedge[k]:
@@ -282,80 +589,113 @@ def blossom_algorithm(edges):
                             labelend[w] = p ^ 1
                     elif label[inblossom[w]] == 1:
                         b = inblossom[v]
-                        if bestedge[b] == -1 or kslack < slack(bestedge[b]):
+                        key = kslack + 2 * total
+                        if bestedge[b] == -1 or key < bestkey[b]:
                             bestedge[b] = k
+                            bestkey[b] = key
+                            heappush(sedges, (key, k, b))
                     elif label[w] == 0:
-                        if bestedge[w] == -1 or kslack < slack(bestedge[w]):
+                        # Inside a T-blossom the key of w is not kept up to date, expand_blossom sets it
+                        if label[inblossom[w]] == 0:
+                            key = kslack + total
+                            if bestedge[w] == -1 or key < bestkey[w]:
+                                bestedge[w] = k
+                                bestkey[w] = key
+                                heappush(freeedges, (key, k, w))
+                        elif bestedge[w] == -1 or kslack < slack(bestedge[w]):
                             bestedge[w] = k
             if augmented:
                 break
             deltatype = -1
             delta = deltaedge = deltablossom = None
 
-            for v in range(nvertex):
-                if label[inblossom[v]] == 0 and bestedge[v] != -1:
-                    d = slack(bestedge[v])
-                    if deltatype == -1 or d < delta:
-                        delta = d
-                        deltatype = 2
-                        deltaedge = bestedge[v]
-
-            for b in range(2 * nvertex):
-                if (blossomparent[b] == -1 and label[b] == 1 and
-                        bestedge[b] != -1):
-                    kslack = slack(bestedge[b])
-                    if isinstance(kslack, int):
-                        d = kslack // 2
-                    else:
-                        d = kslack / 2
-                    if deltatype == -1 or d < delta:
-                        delta = d
-                        deltatype = 3
-                        deltaedge = bestedge[b]
-
-            for b in range(nvertex, 2 * nvertex):
-                if (blossombase[b] >= 0 and blossomparent[b] == -1 and
-                        label[b] == 2 and
-                        (deltatype == -1 or dualvar[b] < delta)):
-                    delta = dualvar[b]
-                    deltatype = 4
-                    deltablossom = b
+            entry = heap_top(freeedges, free_key)
+            if entry is not None:
+                delta = entry[0] - total
+                deltatype = 2
+                deltaedge = entry[1]
+
+            entry = heap_top(sedges, sedge_key)
+            if entry is not None:
+                d = half(entry[0] - 2 * total)
+                if deltatype == -1 or d < delta:
+                    delta = d
+                    deltatype = 3
+                    deltaedge = entry[1]
+
+            entry = heap_top(tblossoms, tblossom_key)
+            if entry is not None and (deltatype == -1 or entry[0] - total < delta):
+                delta = entry[0] - total
+                deltatype = 4
+                deltablossom = entry[1]
 
             if deltatype == -1:
                 deltatype = 1
-                delta = max(0, min(dualvar[:nvertex]))
+                delta = max(0, min(dual(v) for v in range(nvertex)))
 
-            for v in range(nvertex):
-                if label[inblossom[v]] == 1:
-                    dualvar[v] -= delta
-                elif label[inblossom[v]] == 2:
-                    dualvar[v] += delta
-            for b in range(nvertex, 2 * nvertex):
-                if blossombase[b] >= 0 and blossomparent[b] == -1:
-                    if label[b] == 1:
-                        dualvar[b] += delta
-                    elif label[b] == 2:
-                        dualvar[b] -= delta
+            total += delta
             if deltatype == 1:
                 break
             elif deltatype == 2:
                 allowedge[deltaedge] = True
-                (i, j, wt) = edges[deltaedge]
+                i = edgesrc[deltaedge]
+                j = edgedst[deltaedge]
                 if label[inblossom[i]] == 0:
                     i, j = j, i
                 queue.append(i)
             elif deltatype == 3:
                 allowedge[deltaedge] = True
-                (i, j, wt) = edges[deltaedge]
-                queue.append(i)
+                queue.append(edgesrc[deltaedge])
             elif deltatype == 4:
-                expand_blossom(deltablossom, False)
+                expand_blossom(deltablossom)
+        for b in labeled:
+            if blossomparent[b] == -1 and (b < nvertex or blossombase[b] >= 0):
+                settle(b)
         if not augmented:
             break
         for b in range(nvertex, 2 * nvertex):
             if (blossomparent[b] == -1 and blossombase[b] >= 0 and
                     label[b] == 1 and dualvar[b] == 0):
-                expand_blossom(b, True)
+                expand_blossom_endstage(b)
+
+    # The blossom duals are added to the duals of their leaves, which keeps every slack >= 0
+    duals = dualvar[:nvertex]
+    for v in range(nvertex):
+        b = blossomparent[v]
+        while b != -1:
+            duals[v] += dualvar[b]
+            b = blossomparent[b]
+
+    # A cold start keeps every free vertex at the smallest dual, which is what proves that no matching
+    # of the same size weighs more. A warm start does not, so if vertices with edges stay free and that does
+    # not hold at the end, the graph is solved again with an extra vertex for each of them, joined by edges
+    # of weight 0 to every vertex with edges. That graph has a perfect matching, which needs no such proof,
+    # and without the extra vertices it is the heaviest matching of the same size as the current one
+    if warm:
+        free = [v for v in range(nvertex) if mate[v] == -1 and neighbstart[v] < neighbstart[v + 1]]
+        if free and (any(dualvar[v] != dualvar[free[0]] for v in free) or
+                     any(dualvar[v] < dualvar[free[0]] for v in range(nvertex) if mate[v] != -1)):
+            again = dict()
+            touched = np.flatnonzero(np.diff(graph.adjacency()[0]))
+            if len(free) * len(touched) > nedge:
+                pairs, weight = blossom_algorithm(graph, stats=again)
+            else:
+                extended = EdgeList(
+                    np.concatenate([graph.src, np.repeat(np.arange(nvertex, nvertex + len(free)), len(touched))]),
+                    np.concatenate([graph.dst, np.tile(touched, len(free))]),
+                    np.concatenate([graph.weight, np.zeros(len(free) * len(touched), dtype=graph.weight.dtype)]),
+                    nvertex + len(free))
+                current = [(v, endpoint[mate[v]]) for v in range(nvertex) if mate[v] != -1]
+                current += [(v, nvertex + i) for i, v in enumerate(free)]
+                pairs, weight = blossom_algorithm(extended, current, duals + [-duals[v] for v in free], again)
+                pairs = [(i, j) for i, j in pairs if j < nvertex]
+                again['duals'] = again['duals'][:nvertex]
+            if stats is not None:
+                stats.update(again, stages=stages + again['stages'], warm_pairs=warmpairs, restarted=True)
+            return pairs, weight
+
+    if stats is not None:
+        stats.update(stages=stages, warm_pairs=warmpairs, restarted=False, duals=duals)
 
     for v in range(nvertex):
         if mate[v] >= 0:
@@ -370,4 +710,7 @@ def blossom_algorithm(edges):
             used[i] = 1
             pairs.append((i, mt))
 
-    return pairs, sum([w for i, j, w in edges if (i, j) in pairs])
+    # Every pair is (i, mate[i]) with i < mate[i], so an edge is in the matching when it goes the same way
+    mate = np.array(mate, dtype=np.int64)
+    matched = (mate[graph.src] == graph.dst) & (graph.src < graph.dst)
+    return pairs, sum(graph.weight[matched].tolist())
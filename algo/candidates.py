@@ -0,0 +1,101 @@
+from itertools import combinations
+
+import numpy as np
+
+from config import MATCH_VALUE
+
+
+# Keys min * n + max of the unordered pairs (first[k], second[k]), pairs of a user with itself are dropped
+def pair_keys(n, first, second):
+    keep = first != second
+    first, second = first[keep], second[keep]
+    return np.minimum(first, second).astype(np.int64) * n + np.maximum(first, second)
+
+
+# Inverted index over the codes: users[starts[code]:starts[code + 1]] are the users having this code
+def build_index(users, codes, size):
+    keep = codes >= 0
+    users, codes = users[keep], codes[keep]
+    order = np.argsort(codes, kind='stable')
+    users, codes = users[order], codes[order]
+    return users, np.searchsorted(codes, np.arange(size + 1))
+
+
+# Keys of all pairs (left[a], right[b])
+def product_keys(n, left, right):
+    return pair_keys(n, np.repeat(left, len(right)), np.tile(right, len(left)))
+
+
+# Pairs of users that have equal or close codes, users[k] has the code codes[k]
+# If the boolean mask changed is given, only the pairs with at least one changed user are returned
+def close_code_pairs(n, users, codes, close, changed=None):
+    users, starts = build_index(users, codes, close.size)
+    counts = np.diff(starts)
+    keys = [np.zeros(0, dtype=np.int64)]
+    for code in np.nonzero(counts > 1)[0].tolist():
+        group = users[starts[code]:starts[code + 1]]
+        if changed is None:
+            first, second = np.triu_indices(len(group), 1)
+            keys.append(pair_keys(n, group[first], group[second]))
+        else:
+            keys.append(product_keys(n, group[changed[group]], group))
+    for a, b in zip(close.first.tolist(), close.second.tolist()):
+        if counts[a] and counts[b]:
+            group_a = users[starts[a]:starts[a + 1]]
+            group_b = users[starts[b]:starts[b + 1]]
+            if changed is None:
+                keys.append(product_keys(n, group_a, group_b))
+            else:
+                keys.append(product_keys(n, group_a[changed[group_a]], group_b))
+                keys.append(product_keys(n, group_a, group_b[changed[group_b]]))
+    return np.unique(np.concatenate(keys))
+
+
+# Minimal sets of fields that are too weak on their own but reach MATCH_VALUE together
+def weak_combinations(fields):
+    weak = [field for field in fields if field[1] < MATCH_VALUE]
+    result = []
+    for size in range(1, len(weak) + 1):
+        for subset in combinations(weak, size):
+            keys = {field[0] for field in subset}
+            if sum(field[1] for field in subset) >= MATCH_VALUE and \
+                    not any({field[0] for field in smaller} <= keys for smaller in result):
+                result.append(subset)
+    return result
+
+
+# All ordered pairs of users that can reach MATCH_VALUE, in row-major order
+# A pair that is not close in any field with coefficient >= MATCH_VALUE and shares no close interest
+# only gets the weak fields, so it has to be close in every field of one of the weak combinations.
+# Such pairs are looked up by the field of the combination with the biggest vocabulary.
+# With the boolean mask changed only the pairs that have at least one changed user are generated.
+def candidate_pairs(encoding, changed=None):
+    n = encoding.size
+    if MATCH_VALUE <= 0:
+        first, second = np.nonzero(~np.eye(n, dtype=bool))
+        if changed is not None:
+            keep = changed[first] | changed[second]
+            first, second = first[keep], second[keep]
+        return first, second
+    users = np.arange(n)
+    keys = [np.zeros(0, dtype=np.int64)]
+    for key, coefficient, codes, close in encoding.fields:
+        if coefficient >= MATCH_VALUE:
+            keys.append(close_code_pairs(n, users, codes, close, changed))
+    for key, coefficient, codes, close in encoding.lists:
+        list_users = np.repeat(users, codes.shape[1])
+        keys.append(close_code_pairs(n, list_users, codes.reshape(-1), close, changed))
+    for subset in weak_combinations(encoding.fields):
+        key, coefficient, codes, close = max(subset, key=lambda field: field[3].size)
+        subset_keys = close_code_pairs(n, users, codes, close, changed)
+        first, second = subset_keys // n, subset_keys % n
+        keep = np.ones(len(subset_keys), dtype=bool)
+        for key, coefficient, codes, close in subset:
+            keep &= close.lookup(codes[first], codes[second])
+        keys.append(subset_keys[keep])
+    keys = np.unique(np.concatenate(keys))
+    first, second = keys // n, keys % n
+    src = np.concatenate([first, second])
+    dst = np.concatenate([second, first])
+    order = np.lexsort((dst, src))
+    return src[order], dst[order]
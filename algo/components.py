@@ -0,0 +1,38 @@
+import numpy as np
+
+from edges import EdgeList, flat
+
+
+# Union-find over the edges, returns for every vertex the smallest vertex of its connected component
+def connected_components(graph):
+    parent = list(range(graph.size))
+    for i, j in zip(flat(graph.src), flat(graph.dst)):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        while parent[j] != j:
+            parent[j] = parent[parent[j]]
+            j = parent[j]
+        if i < j:
+            parent[j] = i
+        elif j < i:
+            parent[i] = j
+    for v in range(graph.size):
+        parent[v] = parent[parent[v]]
+    return np.array(parent, dtype=np.int64)
+
+
+# Splits the graph into its connected components that have at least one edge
+# Returns a list of (vertices, graph) where graph is an EdgeList over 0..len(vertices)-1
+# and its vertex k is vertices[k] of the whole graph, components come in order of their smallest vertex
+def split_components(graph):
+    if len(graph) == 0:
+        return []
+    labels = connected_components(graph)[graph.src]
+    order = np.argsort(labels, kind='stable')
+    bounds = np.flatnonzero(np.diff(labels[order])) + 1
+    components = []
+    for edges in np.split(order, bounds):
+        vertices, local = np.unique(np.concatenate([graph.src[edges], graph.dst[edges]]), return_inverse=True)
+        components.append((vertices, EdgeList(local[:len(edges)], local[len(edges):], graph.weight[edges], len(vertices))))
+    return components
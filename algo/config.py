@@ -2,12 +2,34 @@
 # Number representing the minimal weighted sum needed in order to make an edge between two people
 MATCH_VALUE = 3  # I think we can get rid of it
 
+# The matching works on integer weights: every weight is multiplied by this and rounded before solving.
+# The history edges average two integer weights, so 2 keeps all of them exact
+WEIGHT_SCALE = 2
+
+# Pools with at least this many users or edges are matched approximately, exact matching would take too long
+APPROXIMATE_USERS = 50000
+APPROXIMATE_EDGES = 5000000
+
+# Seconds the exact matching may take before the pairs of FALLBACK_SOLVER are used instead
+MATCHING_DEADLINE = 30 * 60
+FALLBACK_SOLVER = 'approximate'
+# Share of the deadline the solver runs alone, only a slower solver makes the fallback solver run meanwhile
+FALLBACK_START = 0.5
+
+# Keyword options of the solvers by name, epsilon is the quality knob of the approximate matching:
+# smaller values do more local search passes and get closer to the optimum
+SOLVER_OPTIONS = {'approximate': {'epsilon': 0.001}}
+
+# Days after a run during which its pairs can still get feedback, every run merges these weeks of history again
+FEEDBACK_DAYS = 14
+
+# Documents read per request and writes per batch (the most firestore allows) when talking to the database
+PAGE_SIZE = 500
+BATCH_SIZE = 500
+
 # Default value when there is no edge between 2 vertices
 NO_EDGE_VALUE = 1000000
 
-# Constant for the hungarian algorithm
-INFINITY = 1000000
-
 # Coefficients with which the parameters are included in the final sum
 MATCH_COEFFICIENTS = {
     'year': 1,
@@ -1,26 +1,82 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
 
+from config import BATCH_SIZE, PAGE_SIZE
+from history import KINDS, HistoryRollup, feedback_open_since
+from profiles import USER_FIELDS
+from repository import PAIRS_COLLECTION, week_batches
 
-def init_db():
-    cred = credentials.Certificate("serviceAccount.json")
+# Collection with one rollup document per user, the watermark is kept in the config collection
+ROLLUP_COLLECTION = "history_rollup"
+
+
+def init_db(certificate="serviceAccount.json"):
+    cred = credentials.Certificate(certificate)
     firebase_admin.initialize_app(cred)
 
 
-def get_users(db):
+# Yields the documents of query in pages of page_size, ordered by document id
+# Every page is a separate request that starts after the last document of the previous one
+def read_pages(query, page_size=PAGE_SIZE):
+    query = query.order_by(firestore.FieldPath.document_id()).limit(page_size)
+    last = None
+    while True:
+        page = list((query if last is None else query.start_after(last)).stream())
+        yield from page
+        if len(page) < page_size:
+            break
+        last = page[-1]
+
+
+# Only active users, and only the fields used for matching, are sent by the server
+def get_users(db, page_size=PAGE_SIZE):
     users_ref = db.collection("users")
-    return users_ref.stream()
+    query = users_ref.where(filter=firestore.FieldFilter("is_active", "==", True)).select(USER_FIELDS)
+    return read_pages(query, page_size)
 
 
-def get_history(db):
-    history_ref = db.collection("history")
-    return history_ref.stream()
+def read_rollup(db):
+    users = {
+        document.id: {kind: set(document.get(kind) or ()) for kind in KINDS}
+        for document in read_pages(db.collection(ROLLUP_COLLECTION).select(list(KINDS)))
+    }
+    watermark = db.collection("config").document("history").get()
+    return HistoryRollup(users, watermark.get("watermark") if watermark.exists else None, feedback_open_since())
+
+
+# The rollup documents of the changed users go first, so the watermark never moves past history that is not saved
+def save_rollup(db, rollup):
+    changed = sorted(rollup.changed)
+    for start in range(0, len(changed), BATCH_SIZE):
+        batch = db.batch()
+        for user in changed[start:start + BATCH_SIZE]:
+            sets = rollup.users[user]
+            batch.set(db.collection(ROLLUP_COLLECTION).document(user), {kind: sorted(sets[kind]) for kind in KINDS})
+        batch.commit()
+    if rollup.watermark is not None:
+        db.collection("config").document("history").set({"watermark": rollup.watermark})
+    rollup.changed = set()
+
 
+# The pairs of a week document, weeks written before the pairs collection keep them in a match_pairs array
+def week_pairs(week):
+    data = week.to_dict()
+    if "match_pairs" in data:
+        return data["match_pairs"]
+    return [pair.to_dict() for pair in read_pages(week.reference.collection(PAIRS_COLLECTION))]
 
-def get_data():
-    init_db()
-    db = firestore.client()
-    return get_users(db), get_history(db)
+
+# Reads only the history documents newer than the watermark and merges them into the stored rollup,
+# the weeks that can still get feedback are among them every time
+def get_history(db):
+    rollup = read_rollup(db)
+    history_ref = db.collection("history")
+    if rollup.watermark is not None:
+        history_ref = history_ref.where(filter=firestore.FieldFilter("timestamp", ">", rollup.watermark))
+    for week in history_ref.stream():
+        rollup.merge_week(week_pairs(week), week.get("timestamp"))
+    save_rollup(db, rollup)
+    return rollup
 
 
 def set_config_true(db):
@@ -28,22 +84,30 @@ def set_config_true(db):
     conf.update({"send": True})
 
 
-def update(pairs):
-    db = firestore.client()
-    history_ref = db.collection("history")
-    match_pairs = {
-        'timestamp': firestore.SERVER_TIMESTAMP,
-        "match_pairs": [
-            {
-                "user1_id": pair[0],
-                "user1_isLike": 0,
-                "user2_id": pair[1],
-                "user2_isLike": 0,
-                "meeting_happened": None,
-            }
-            for pair in pairs
-        ]
-    }
+# stats is the dict filled by matching.create_new_pairs, the solver and its time are kept with the pairs
+# The week document and its pair documents are committed in batches of BATCH_SIZE writes,
+# the send flag is set only after the last one, so the bot never reads a week that is not complete
+def update(db, pairs, stats=None):
+    week_ref = db.collection("history").document()
+    for writes in week_batches(pairs, stats, firestore.SERVER_TIMESTAMP):
+        batch = db.batch()
+        for id, document in writes:
+            batch.set(week_ref if id is None else week_ref.collection(PAIRS_COLLECTION).document(id), document)
+        batch.commit()
     set_config_true(db)
-    history_ref.add(match_pairs)
-    # print(pairs)
+
+
+# The matching data in firestore, see repository.MemoryRepository for the same interface without firestore
+class FirestoreRepository:
+    def __init__(self, certificate="serviceAccount.json"):
+        init_db(certificate)
+        self.db = firestore.client()
+
+    def get_users(self):
+        return get_users(self.db)
+
+    def get_history(self):
+        return get_history(self.db)
+
+    def update(self, pairs, stats=None):
+        update(self.db, pairs, stats)
@@ -0,0 +1,69 @@
+def normalize_string(s):
+    return ''.join(e.lower() for e in s if e.isalnum())
+
+
+def levenshtein_distance(s1, s2):
+    dp = [[0 for _ in range(len(s2) + 1)] for _ in range(len(s1) + 1)]
+
+    for i in range(len(s1) + 1):
+        dp[i][0] = i
+    for j in range(len(s2) + 1):
+        dp[0][j] = j
+
+    for i in range(1, len(s1) + 1):
+        for j in range(1, len(s2) + 1):
+            if s1[i - 1] == s2[j - 1]:
+                dp[i][j] = dp[i - 1][j - 1]
+            else:
+                dp[i][j] = min(dp[i - 1][j], dp[i][j - 1], dp[i - 1][j - 1]) + 1
+
+    return dp[len(s1)][len(s2)]
+
+
+# Levenshtein distance that only looks at the diagonal band of width 2 * bound + 1
+# Returns bound + 1 as soon as it is clear that the distance is bigger than bound
+def bounded_levenshtein(s1, s2, bound):
+    len1 = len(s1)
+    len2 = len(s2)
+    if abs(len1 - len2) > bound:
+        return bound + 1
+    # Common prefix and suffix do not change the distance
+    start = 0
+    while start < len1 and start < len2 and s1[start] == s2[start]:
+        start += 1
+    while len1 > start and len2 > start and s1[len1 - 1] == s2[len2 - 1]:
+        len1 -= 1
+        len2 -= 1
+    n = len1 - start
+    m = len2 - start
+    if n == 0 or m == 0:
+        return max(n, m)
+    inf = bound + 1
+    width = 2 * bound + 1
+    # row[d] holds the cell (i, i + d - bound), the last element is a sentinel
+    row = [inf] * (width + 1)
+    for d in range(bound, width):
+        row[d] = d - bound
+    for i in range(1, n + 1):
+        c1 = s1[start + i - 1]
+        left = inf
+        best = inf
+        for d in range(width):
+            j = i + d - bound
+            if j < 0 or j > m:
+                value = inf
+            elif j == 0:
+                value = i
+            else:
+                value = row[d] + (c1 != s2[start + j - 1])
+                if row[d + 1] + 1 < value:
+                    value = row[d + 1] + 1
+                if left + 1 < value:
+                    value = left + 1
+            row[d] = value
+            left = value
+            if value < best:
+                best = value
+        if best > bound:
+            return inf
+    return min(row[m - n + bound], inf)
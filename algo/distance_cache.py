@@ -0,0 +1,77 @@
+import os
+import sqlite3
+from collections import OrderedDict
+
+from distance import bounded_levenshtein
+
+# File where the decisions are kept between the weekly runs, next to this script wherever it is run from
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'distance_cache.sqlite')
+
+# Number of decisions kept in memory in front of the file
+CACHE_SIZE = 1 << 18
+
+
+# Memoizes "within threshold" decisions for pairs of normalized values of a field
+# Lookups go to an in-memory LRU first, then to the SQLite file, and only then the distance is computed
+# The bound is stored with every decision, so changing MAX_DISTANCE does not return stale answers
+class DistanceCache:
+    def __init__(self, path=CACHE_PATH, size=CACHE_SIZE):
+        self.size = size
+        self.memory = OrderedDict()
+        self.pending = []
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS decisions ('
+            'field TEXT, a TEXT, b TEXT, bound INTEGER, close INTEGER, PRIMARY KEY (field, a, b)'
+            ') WITHOUT ROWID'
+        )
+
+    def within(self, field, a, b, bound):
+        if a > b:
+            a, b = b, a
+        key = (field, a, b)
+        cached = self.memory.get(key)
+        if cached is not None and cached[0] == bound:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return cached[1]
+        row = self.connection.execute(
+            'SELECT bound, close FROM decisions WHERE field = ? AND a = ? AND b = ?', key
+        ).fetchone()
+        if row is not None and row[0] == bound:
+            self.disk_hits += 1
+            close = bool(row[1])
+        else:
+            self.misses += 1
+            close = bounded_levenshtein(a, b, bound) <= bound
+            self.pending.append((field, a, b, bound, int(close)))
+        self.memory[key] = (bound, close)
+        if len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+        return close
+
+    # Function telling if two values of the field are close, in the form used by fuzzy
+    def checker(self, field, bound):
+        return lambda a, b: self.within(field, a, b, bound)
+
+    def flush(self):
+        self.connection.executemany('INSERT OR REPLACE INTO decisions VALUES (?, ?, ?, ?, ?)', self.pending)
+        self.connection.commit()
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'lookups': lookups,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,72 @@
+import hashlib
+import os
+
+import numpy as np
+
+from config import MATCH_VALUE, MATCH_COEFFICIENTS, MAX_DISTANCE
+
+# File with the scored edges of the previous run, next to this script wherever it is run from
+EDGE_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'edge_store.npz')
+
+
+def fingerprint(value):
+    return int.from_bytes(hashlib.blake2b(repr(value).encode(), digest_size=8).digest(), 'little', signed=True)
+
+
+# Hash of the matching fields of a profile, the weight of a pair depends only on the two profiles
+def profile_fingerprint(profile):
+    return fingerprint(tuple(getattr(profile, key) for key in MATCH_COEFFICIENTS))
+
+
+# The stored weights are only valid for the configuration they were computed with
+def config_fingerprint():
+    return fingerprint((MATCH_VALUE, sorted(MATCH_COEFFICIENTS.items()), sorted(MAX_DISTANCE.items())))
+
+
+# Scored edges of the last run (before used pairs are removed) together with a fingerprint of every profile
+# update rescores only the users whose fingerprint changed plus the users that were not in the last pool,
+# the edges between two unchanged users are taken from the file
+class EdgeStore:
+    def __init__(self, path=EDGE_STORE_PATH):
+        self.path = path
+        self.rescored = 0
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with np.load(self.path) as data:
+            if int(data['config']) != config_fingerprint():
+                return None
+            return {key: data[key] for key in ('ids', 'fingerprints', 'src', 'dst', 'weight')}
+
+    def save(self, ids, fingerprints, src, dst, weight):
+        with open(self.path, 'wb') as file:
+            np.savez(file, config=np.int64(config_fingerprint()), ids=np.array(ids, dtype=str),
+                     fingerprints=fingerprints, src=src.astype(np.int32), dst=dst.astype(np.int32), weight=weight)
+
+    # score(changed) returns the edges (src, dst, weight) that have at least one user from the mask changed,
+    # or all edges when changed is None
+    def update(self, ids, profiles, score):
+        fingerprints = np.array([profile_fingerprint(profile) for profile in profiles], dtype=np.int64)
+        stored = self.load()
+        if stored is None:
+            self.rescored = len(ids)
+            src, dst, weight = score(None)
+        else:
+            position = {user: ind for ind, user in enumerate(ids)}
+            old_to_new = np.array([position.get(user, -1) for user in stored['ids'].tolist()], dtype=np.int64)
+            found = old_to_new >= 0
+            unchanged_old = found.copy()
+            unchanged_old[found] = fingerprints[old_to_new[found]] == stored['fingerprints'][found]
+            changed = np.ones(len(ids), dtype=bool)
+            changed[old_to_new[unchanged_old]] = False
+            self.rescored = int(changed.sum())
+            keep = unchanged_old[stored['src']] & unchanged_old[stored['dst']]
+            new_src, new_dst, new_weight = score(changed)
+            src = np.concatenate([old_to_new[stored['src'][keep]], new_src])
+            dst = np.concatenate([old_to_new[stored['dst'][keep]], new_dst])
+            weight = np.concatenate([stored['weight'][keep], new_weight])
+            order = np.lexsort((dst, src))
+            src, dst, weight = src[order], dst[order], weight[order]
+        self.save(ids, fingerprints, src, dst, weight)
+        return src, dst, weight
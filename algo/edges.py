@@ -0,0 +1,81 @@
+from array import array
+
+import numpy as np
+
+
+# Graph stored as parallel arrays: edge k connects src[k] and dst[k] with weight weight[k]
+# Vertices are 0..size-1, weights are int64 or float64
+class EdgeList:
+    def __init__(self, src, dst, weight, size=None):
+        self.src = np.ascontiguousarray(src, dtype=np.int64)
+        self.dst = np.ascontiguousarray(dst, dtype=np.int64)
+        weight = np.asarray(weight)
+        self.weight = np.ascontiguousarray(weight, dtype=np.float64 if weight.dtype.kind == 'f' else np.int64)
+        if size is None:
+            size = int(max(self.src.max(), self.dst.max())) + 1 if len(self.src) else 0
+        self.size = size
+        self.adjacency_cache = None
+
+    # Builds the container from the old [[i, j, w], ...] form
+    @classmethod
+    def from_lists(cls, graph, size=None):
+        if not graph:
+            return cls([], [], np.zeros(0, dtype=np.int64), size)
+        src, dst, weight = zip(*graph)
+        return cls(src, dst, weight, size)
+
+    def __len__(self):
+        return len(self.src)
+
+    def __iter__(self):
+        return zip(self.src.tolist(), self.dst.tolist(), self.weight.tolist())
+
+    def tolist(self):
+        return [list(edge) for edge in self]
+
+    # New container with the given [[i, j, w], ...] edges added at the end
+    def extend(self, graph):
+        if not graph:
+            return self
+        other = EdgeList.from_lists(graph)
+        return EdgeList(np.concatenate([self.src, other.src]), np.concatenate([self.dst, other.dst]),
+                        np.concatenate([self.weight, other.weight]), max(self.size, other.size))
+
+    # Same graph with every weight multiplied by scale and rounded to int64, the adjacency is shared
+    def scaled(self, scale):
+        graph = EdgeList(self.src, self.dst, np.rint(self.weight * scale).astype(np.int64), self.size)
+        graph.adjacency_cache = self.adjacency_cache
+        return graph
+
+    # Endpoint p of edge p // 2: even endpoints are src, odd endpoints are dst
+    def endpoints(self):
+        endpoint = np.empty(2 * len(self), dtype=np.int64)
+        endpoint[0::2] = self.src
+        endpoint[1::2] = self.dst
+        return endpoint
+
+    # CSR adjacency: for vertex v, ends[starts[v]:starts[v + 1]] are the endpoints p of the other ends
+    # of the edges of v (p ^ 1 is v itself), in the order of the edges
+    def adjacency(self):
+        if self.adjacency_cache is None:
+            ends = np.concatenate([2 * np.arange(len(self)) + 1, 2 * np.arange(len(self))])
+            owner = np.concatenate([self.src, self.dst])
+            # Edges of a vertex come in edge order, the same as the lists that were built before
+            order = np.lexsort((ends // 2, owner))
+            self.adjacency_cache = (np.searchsorted(owner[order], np.arange(self.size + 1)), ends[order])
+        return self.adjacency_cache
+
+
+# Copy of a numpy array as a flat array.array of int64 or float64: one machine number per item instead of a python
+# int object, and indexing it still gives plain python numbers, unlike numpy scalars
+def flat(values):
+    values = np.asarray(values)
+    if values.dtype.kind == 'f':
+        return array('d', np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return array('q', np.ascontiguousarray(values, dtype=np.int64).tobytes())
+
+
+def as_edge_list(graph):
+    if isinstance(graph, EdgeList):
+        return graph
+    return EdgeList.from_lists(graph)
@@ -0,0 +1,100 @@
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from distance import bounded_levenshtein
+
+# Length of the substrings used to index long values
+GRAM_SIZE = 2
+
+
+def default_within(bound):
+    return lambda a, b: bounded_levenshtein(a, b, bound) <= bound
+
+
+# Multiset of the q-grams of s, every repeated gram gets its occurrence number so the result is a set
+def gram_tokens(s):
+    seen = Counter()
+    tokens = []
+    for i in range(len(s) - GRAM_SIZE + 1):
+        gram = s[i:i + GRAM_SIZE]
+        tokens.append((gram, seen[gram]))
+        seen[gram] += 1
+    return tokens
+
+
+# Returns two arrays (first[i] < second[i]) with all pairs of distinct values that are within bound
+# Two strings within distance bound share at least max(len) - GRAM_SIZE + 1 - bound * GRAM_SIZE grams,
+# so when this number is positive their bound * GRAM_SIZE + 1 rarest grams must intersect (prefix filter).
+# Values that are too short for the filter are compared with every short value of a similar length.
+# within(a, b) makes the final decision, by default it computes the bounded distance
+def close_value_pairs(vocabulary, bound, within=None):
+    first = []
+    second = []
+    if bound == 0:
+        return np.array(first, dtype=np.int64), np.array(second, dtype=np.int64)
+    within = within or default_within(bound)
+    short_length = bound * GRAM_SIZE + GRAM_SIZE - 1
+    lengths = [len(value) for value in vocabulary]
+
+    def check(a, b):
+        if abs(lengths[a] - lengths[b]) <= bound and within(vocabulary[a], vocabulary[b]):
+            first.append(min(a, b))
+            second.append(max(a, b))
+
+    short = sorted((ind for ind in range(len(vocabulary)) if lengths[ind] <= short_length), key=lambda ind: lengths[ind])
+    for pos, a in enumerate(short):
+        for b in short[pos + 1:]:
+            if lengths[b] - lengths[a] > bound:
+                break
+            check(a, b)
+
+    tokens = [gram_tokens(value) for value in vocabulary]
+    frequency = Counter(token for value_tokens in tokens for token in value_tokens)
+    index = defaultdict(list)
+    for ind, value_tokens in enumerate(tokens):
+        prefix = sorted(value_tokens, key=lambda token: (frequency[token], token))[:bound * GRAM_SIZE + 1]
+        candidates = set()
+        for token in prefix:
+            candidates.update(index[token])
+            index[token].append(ind)
+        for other in candidates:
+            if lengths[ind] > short_length or lengths[other] > short_length:
+                check(other, ind)
+    return np.array(first, dtype=np.int64), np.array(second, dtype=np.int64)
+
+
+# Every string that can be obtained from value by deleting at most bound characters
+def deletions(value, bound):
+    result = {value}
+    layer = {value}
+    for _ in range(bound):
+        layer = {variant[:i] + variant[i + 1:] for variant in layer for i in range(len(variant))}
+        result |= layer
+    return result
+
+
+# SymSpell-style index over a vocabulary of short strings
+# Two strings within distance bound always share a string of their deletion neighbourhoods,
+# so a lookup only verifies the values that share one instead of the whole vocabulary
+class DeletionIndex:
+    def __init__(self, vocabulary, bound, within=None):
+        self.vocabulary = list(vocabulary)
+        self.bound = bound
+        self.within = within or default_within(bound)
+        self.index = defaultdict(list)
+        for ind, value in enumerate(self.vocabulary):
+            for variant in deletions(value, bound):
+                self.index[variant].append(ind)
+
+    # Values of the vocabulary within bound of value
+    def lookup(self, value):
+        checked = set()
+        found = set()
+        for variant in deletions(value, self.bound):
+            for ind in self.index.get(variant, ()):
+                if ind not in checked:
+                    checked.add(ind)
+                    if self.within(value, self.vocabulary[ind]):
+                        found.add(self.vocabulary[ind])
+        return frozenset(found)
@@ -1,46 +1,41 @@
-from config import MATCH_VALUE, MATCH_COEFFICIENTS, MAX_DISTANCE, NO_EDGE_VALUE
-
-
-def normalize_string(s):
-    return ''.join(e.lower() for e in s if e.isalnum())
-
-
-def levenshtein_distance(s1, s2):
-    dp = [[0 for _ in range(len(s2) + 1)] for _ in range(len(s1) + 1)]
-
-    for i in range(len(s1) + 1):
-        dp[i][0] = i
-    for j in range(len(s2) + 1):
-        dp[0][j] = j
-
-    for i in range(1, len(s1) + 1):
-        for j in range(1, len(s2) + 1):
-            if s1[i - 1] == s2[j - 1]:
-                dp[i][j] = dp[i - 1][j - 1]
-            else:
-                dp[i][j] = min(dp[i - 1][j], dp[i][j - 1], dp[i - 1][j - 1]) + 1
+import numpy as np
 
-    return dp[len(s1)][len(s2)]
+import candidates
+import parallel
+import scoring
+from config import MATCH_VALUE, MATCH_COEFFICIENTS, MAX_DISTANCE, NO_EDGE_VALUE
+from distance import normalize_string, levenshtein_distance, bounded_levenshtein
+from edge_store import profile_fingerprint
+from edges import EdgeList
+from history import HistoryIndex
+from profiles import make_profile, resolve_interests
 
 
-def determine_distance(s1, s2):
+# If bound is given the exact distance is only computed up to bound, anything bigger is returned as bound + 1
+def determine_distance(s1, s2, bound=None):
     s1 = normalize_string(s1)
     s2 = normalize_string(s2)
-    return levenshtein_distance(s1, s2)
+    if bound is None:
+        return levenshtein_distance(s1, s2)
+    return bounded_levenshtein(s1, s2, bound)
 
 
+# Both profiles come from the profile table, so the values are already normalized
 def calculate_weight(u, v):
     res = 0
-    for key in u.keys():
-        if key in MATCH_COEFFICIENTS:
-            if key == 'interests':
-                for interest1 in u[key]:
-                    for interest2 in v[key]:
-                        if determine_distance(interest1, interest2) <= MAX_DISTANCE[key]:
-                            res += MATCH_COEFFICIENTS[key]
-            else:
-                if determine_distance(u[key], v[key]) <= MAX_DISTANCE[key]:
-                    res += MATCH_COEFFICIENTS[key]
+    for key in MATCH_COEFFICIENTS:
+        value1 = getattr(u, key)
+        value2 = getattr(v, key)
+        if value1 is None or value2 is None:
+            continue
+        if key == 'interests':
+            for neighbours in u.interest_neighbours:
+                for interest2 in value2:
+                    if interest2 in neighbours:
+                        res += MATCH_COEFFICIENTS[key]
+        else:
+            if bounded_levenshtein(value1, value2, MAX_DISTANCE[key]) <= MAX_DISTANCE[key]:
+                res += MATCH_COEFFICIENTS[key]
     return res
 
 
@@ -48,76 +43,89 @@ def are_close(u, v):
     return calculate_weight(u, v) >= MATCH_VALUE
 
 
-def build_initial_graph(users, users_id, users_info, used_pairs):
+# Scores the candidate pairs that have at least one user from the mask changed (all pairs if it is None)
+# With workers > 1 the pairs are scored by a process pool, the result is the same
+def score_edges(encoding, workers, changed=None):
+    src, dst = candidates.candidate_pairs(encoding, changed)
+    if workers > 1:
+        return parallel.score_pairs_parallel(encoding, src, dst, workers)
+    return scoring.score_pairs(encoding, src, dst)
+
+
+# history is the HistoryIndex of the pool, pairs whose meeting already happened get no edge
+# store is an optional EdgeStore, then only the users whose profile changed since the last run are rescored
+def build_initial_graph(users, users_id, users_info, history, cache=None, workers=1, store=None):
+    ids = np.array([users_id[user] for user in users], dtype=np.int64)
+    profiles = [users_info[user] for user in users]
+    encoding = scoring.ProfileEncoding(profiles, cache)
+    if store is None:
+        src, dst, weights = score_edges(encoding, workers)
+    else:
+        src, dst, weights = store.update(users, profiles, lambda changed: score_edges(encoding, workers, changed))
+    src, dst = ids[src], ids[dst]
+    keep = ~history.has_happened(src, dst)
+    return EdgeList(src[keep], dst[keep], weights[keep], len(users))
+
+
+# Pure python version of build_initial_graph, the scoring engine is tested against it
+def build_initial_graph_reference(users, users_id, users_info, history):
     graph = []
     for user1 in users:
         for user2 in users:
             if user1 == user2:
                 continue
-            if are_close(users_info[user1], users_info[user2]) and (users_id[user1], users_id[user2]) not in used_pairs:
+            if are_close(users_info[user1], users_info[user2]) and not history.has_happened(users_id[user1], users_id[user2]):
                 graph.append([users_id[user1], users_id[user2], calculate_weight(users_info[user1], users_info[user2])])
     return graph
 
 
-def build_graph_with_history(graph, history, users_id, users_info, users_ind, used_pairs):
-    n = len(graph)
-    meets = set()
-    for previous_match in history:
-        for pair in previous_match.to_dict()['match_pairs']:
-            meets.add((users_id[pair['user1_id']], users_id[pair['user2_id']]))
-            meets.add((users_id[pair['user2_id']], users_id[pair['user1_id']]))
-    good_meets = [[] for _ in range(n)]
-    for previous_match in history:
-        for pair in previous_match.to_dict()['match_pairs']:
-            user1 = users_id[pair['user1_id']]
-            user2 = users_id[pair['user2_id']]
-            if pair['user1_isLike'] == 1 and pair['user2_isLike'] == 1 and (user1, user2) not in meets:
-                good_meets[user1].append(user2)
-                good_meets[user2].append(user1)
-    for i in range(n):
-        for user1 in good_meets[i]:
-            for user2 in good_meets[i]:
-                if calculate_weight(users_info[user1], users_info[user2]) < MATCH_VALUE \
-                        and (user1, user2) not in meets and (user1, user2) not in used_pairs:
-                    w = (calculate_weight(users_info[user1], users_info[user2]) +
-                                       (calculate_weight(users_info[users_ind[i]], users_info[user1]) +
-                                        calculate_weight(users_info[users_ind[i]], users_info[user2])) / 2)
-                    graph.append([user1, user2, w])
-    return graph
-
-
-def get_users(users_data):
+# For every user i, two people who both liked their meeting with i get an edge even if they are not close,
+# unless they have already met. The weight adds the average closeness to i to their own weight.
+def build_graph_with_history(graph, history, users_info, users_ind):
+    extra = []
+    for i in range(len(users_ind)):
+        liked = history.liked(i).tolist()
+        for user1 in liked:
+            for user2 in liked:
+                if user1 == user2 or history.has_met(user1, user2):
+                    continue
+                weight = calculate_weight(users_info[users_ind[user1]], users_info[users_ind[user2]])
+                if weight < MATCH_VALUE:
+                    w = (weight + (calculate_weight(users_info[users_ind[i]], users_info[users_ind[user1]]) +
+                                   calculate_weight(users_info[users_ind[i]], users_info[users_ind[user2]])) / 2)
+                    extra.append([user1, user2, w])
+    return graph.extend(extra)
+
+
+def get_users(users_data, cache=None):
     users = []
     users_info = dict()
     users_id = dict()
     users_ind = []
     cnt = 0
     for user in users_data:
-        if user.to_dict()["is_active"]:
+        data = user.to_dict()
+        if data["is_active"]:
             users.append(user.id)
-            users_info[user.id] = user.to_dict()
+            users_info[user.id] = make_profile(data)
             users_id[user.id] = cnt
             cnt += 1
             users_ind.append(user.id)
+    resolve_interests(users_info.values(), cache)
     return users, users_info, users_id, users_ind
 
 
-def get_used_pairs(users_id, history_data):
-    used_pairs = set()
-    for previous_match in history_data:
-        for pair in previous_match.to_dict()['match_pairs']:
-            if pair['meeting_happened']:
-                user1 = users_id[pair['user1_id']]
-                user2 = users_id[pair['user2_id']]
-                used_pairs.add((user1, user2))
-                used_pairs.add((user2, user1))
-    return used_pairs
-
-
-def build_graph(users_data, history_data):
-    users, users_info, users_id, users_ind = get_users(users_data)
-    used_pairs = get_used_pairs(users_id, history_data)
-    initial_graph = build_initial_graph(users, users_id, users_info, used_pairs)
-    graph = build_graph_with_history(initial_graph, history_data, users_id, users_info, users_ind, used_pairs)
+# history_data is the history documents or a HistoryRollup of them
+# cache is an optional DistanceCache that keeps the field distance decisions between runs
+# workers is the number of processes used to score the user pairs
+# store is an optional EdgeStore with the edges of the previous run
+# If stats is a dict, the profile fingerprint of every user in users_ind order is written to it as profile_hashes
+def build_graph(users_data, history_data, cache=None, workers=1, store=None, stats=None):
+    users, users_info, users_id, users_ind = get_users(users_data, cache)
+    history = HistoryIndex(users_id, history_data)
+    initial_graph = build_initial_graph(users, users_id, users_info, history, cache, workers, store)
+    graph = build_graph_with_history(initial_graph, history, users_info, users_ind)
     # print(graph)
+    if stats is not None:
+        stats['profile_hashes'] = [profile_fingerprint(users_info[user]) for user in users_ind]
     return graph, users_ind
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from config import FEEDBACK_DAYS
+
+
+# Kinds of pairs kept for every user: they were matched, the meeting happened, both liked it
+KINDS = ('met', 'happened', 'liked')
+
+
+# Runs from this time on can still get feedback
+def feedback_open_since():
+    return datetime.now(timezone.utc) - timedelta(days=FEEDBACK_DAYS)
+
+
+# The kinds a history pair belongs to
+def pair_kinds(pair):
+    kinds = ['met']
+    if pair.get('meeting_happened'):
+        kinds.append('happened')
+    if pair.get('user1_isLike') == 1 and pair.get('user2_isLike') == 1:
+        kinds.append('liked')
+    return kinds
+
+
+# History folded into per-user sets: users[u][kind] is the set of users that u has a pair of this kind with
+# watermark is the newest timestamp of the merged history documents whose feedback is final,
+# only newer documents have to be merged later
+# Documents from open_since on can still get feedback, they are merged but do not move the watermark,
+# so they are merged again by the next runs, which is safe since merging only adds to the sets
+# changed keeps the users whose sets grew since the rollup was loaded
+class HistoryRollup:
+    def __init__(self, users=None, watermark=None, open_since=None):
+        self.users = users if users is not None else dict()
+        self.watermark = watermark
+        self.open_since = open_since
+        self.changed = set()
+
+    def add(self, kind, user1, user2):
+        for u, v in ((user1, user2), (user2, user1)):
+            if u not in self.users:
+                self.users[u] = {key: set() for key in KINDS}
+            if v not in self.users[u][kind]:
+                self.users[u][kind].add(v)
+                self.changed.add(u)
+
+    # history_data are documents that keep the pairs of a week in a match_pairs array
+    def merge(self, history_data):
+        for previous_match in history_data:
+            data = previous_match.to_dict()
+            self.merge_week(data['match_pairs'], data.get('timestamp'))
+
+    def merge_week(self, pairs, timestamp=None):
+        for pair in pairs:
+            for kind in pair_kinds(pair):
+                self.add(kind, pair['user1_id'], pair['user2_id'])
+        if timestamp is None or (self.open_since is not None and timestamp >= self.open_since):
+            return
+        if self.watermark is None or timestamp > self.watermark:
+            self.watermark = timestamp
+
+    # Pairs of every kind as index pairs over the pool, users that are not in the pool are skipped
+    def pairs(self, users_id):
+        pairs = {kind: [] for kind in KINDS}
+        for user, sets in self.users.items():
+            user1 = users_id.get(user)
+            if user1 is None:
+                continue
+            for kind in KINDS:
+                for other in sets[kind]:
+                    user2 = users_id.get(other)
+                    if user2 is not None:
+                        pairs[kind].append((user1, user2))
+        return pairs
+
+
+# Everything the graph stages need from the history, built in a single pass over the history documents
+# or from a HistoryRollup
+# Pairs are stored as sorted int64 keys min * n + max over the indices of the current pool,
+# mutual likes as a CSR adjacency (liked[u] = neighbours[starts[u]:starts[u + 1]])
+class HistoryIndex:
+    def __init__(self, users_id, history_data):
+        self.size = len(users_id)
+        if isinstance(history_data, HistoryRollup):
+            pairs = history_data.pairs(users_id)
+        else:
+            pairs = {kind: [] for kind in KINDS}
+            for previous_match in history_data:
+                for pair in previous_match.to_dict()['match_pairs']:
+                    user1 = users_id.get(pair['user1_id'])
+                    user2 = users_id.get(pair['user2_id'])
+                    # Users that are not in the pool this week can not get an edge anyway
+                    if user1 is None or user2 is None:
+                        continue
+                    for kind in pair_kinds(pair):
+                        pairs[kind].append((user1, user2))
+        met, happened, liked = (self.keys(pairs[kind]) for kind in KINDS)
+        self.met = met
+        self.happened = happened
+        first = liked // max(self.size, 1)
+        second = liked % max(self.size, 1)
+        src = np.concatenate([first, second])
+        dst = np.concatenate([second, first])
+        order = np.lexsort((dst, src))
+        self.neighbours = dst[order]
+        self.starts = np.searchsorted(src[order], np.arange(self.size + 1))
+
+    # Sorted unique keys of a list of index pairs
+    def keys(self, pairs):
+        if not pairs:
+            return np.zeros(0, dtype=np.int64)
+        pairs = np.array(pairs, dtype=np.int64)
+        return np.unique(self.key(pairs[:, 0], pairs[:, 1]))
+
+    def key(self, a, b):
+        return np.minimum(a, b).astype(np.int64) * self.size + np.maximum(a, b)
+
+    # Works for single indices and for arrays of indices
+    def contains(self, keys, a, b):
+        if len(keys) == 0:
+            return np.zeros(np.shape(a), dtype=bool)
+        pair = self.key(a, b)
+        return keys[np.minimum(np.searchsorted(keys, pair), len(keys) - 1)] == pair
+
+    def has_met(self, a, b):
+        return self.contains(self.met, a, b)
+
+    def has_happened(self, a, b):
+        return self.contains(self.happened, a, b)
+
+    # Users that liked the meeting with u and were liked back
+    def liked(self, u):
+        return self.neighbours[self.starts[u]:self.starts[u + 1]]
@@ -1,15 +1,46 @@
-import database
+import sys
+
 import graph_builder
 import matching
+import parallel
+import snapshot
+from config import MATCHING_DEADLINE, SOLVER_OPTIONS
+from distance_cache import CACHE_PATH, DistanceCache
+from edge_store import EDGE_STORE_PATH, EdgeStore
 
 
-def make_pairs():
-    users, history = database.get_data()
-    graph, users_ind = graph_builder.build_graph(users, history)
-    pairs = matching.create_new_pairs(graph)
+# repository gives the users and history and takes the pairs, see repository.py
+# By default it is the firestore one, which is only imported then, so other repositories work without firebase_admin
+# cache_path and store_path are the files of the DistanceCache and the EdgeStore kept between runs
+# If snapshot_dir is given, the graph is saved there for snapshot.replay
+def make_pairs(repository=None, cache_path=CACHE_PATH, store_path=EDGE_STORE_PATH, snapshot_dir=None):
+    if repository is None:
+        import database
+        repository = database.FirestoreRepository()
+    users, history = repository.get_users(), repository.get_history()
+    cache = DistanceCache(cache_path)
+    store = EdgeStore(store_path)
+    graph_stats = dict()
+    # The decisions found before a failure are still worth keeping
+    try:
+        graph, users_ind = graph_builder.build_graph(users, history, cache, parallel.WORKERS, store, graph_stats)
+    finally:
+        cache.close()
+    if snapshot_dir is not None:
+        print(f"Snapshot: {snapshot.save_run(graph, users_ind, graph_stats['profile_hashes'], snapshot_dir)}")
+    print(f"Distance cache: {cache.stats()}")
+    print(f"Rescored {store.rescored} of {len(users_ind)} users")
+    stats = dict()
+    pairs = matching.create_new_pairs(graph, parallel.WORKERS, stats=stats, deadline=MATCHING_DEADLINE,
+                                     solver_options=SOLVER_OPTIONS)
+    if stats['solver_error'] is not None:
+        print(f"Exact solver crashed: {stats['solver_error']}")
+    print(f"Matched by {stats['solver']} in {stats['seconds']:.1f}s, "
+          f"weight {stats['weight']} of at most {stats['upper_bound']}")
     pairs = [(users_ind[i], users_ind[j]) for (i, j) in pairs]
-    database.update(pairs)
+    repository.update(pairs, stats)
 
 
+# python make_pairs.py --snapshot also saves the graph to snapshot.SNAPSHOT_DIR
 if __name__ == "__main__":
-    make_pairs()
+    make_pairs(snapshot_dir=snapshot.SNAPSHOT_DIR if '--snapshot' in sys.argv[1:] else None)
@@ -1,15 +1,32 @@
-from config import INFINITY
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from queue import Empty
+
+import numpy as np
+
+from config import APPROXIMATE_EDGES, APPROXIMATE_USERS, FALLBACK_SOLVER, FALLBACK_START, NO_EDGE_VALUE, WEIGHT_SCALE
+from approximate import EPSILON, approximate_matching, vertex_bound
 from blossom import blossom_algorithm
+from components import split_components
+from edges import as_edge_list
+
+# Components with at least this many edges are solved in the process pool, smaller ones right here
+POOL_COMPONENT_EDGES = 2000
 
 
 # Greedy approach to compare with smart algorithm
+# graph is an EdgeList or a list of [i, j, w]
 def greedy(graph):
-    edges = sorted(graph, key=lambda x: -x[2])
-    n = max([max(i, j) for i, j, w in graph]) + 1
-    used = [0] * n
+    graph = as_edge_list(graph)
+    order = np.argsort(-graph.weight, kind='stable')
+    used = [0] * graph.size
     cost = 0
     res = []
-    for i, j, value in edges:
+    for i, j, value in zip(memoryview(graph.src[order]), memoryview(graph.dst[order]), memoryview(graph.weight[order])):
         if used[i] == 0 and used[j] == 0:
             used[i] = 1
             used[j] = 1
@@ -18,45 +35,108 @@ def greedy(graph):
     return res, cost
 
 
-# Function to make an offset in the graph so that the implementation of algorithm is easier
-def preprocess_graph(graph):
-    return [[0] * (len(graph) + 1), *([0] + graph[i] for i in range(len(graph)))]
+# Dense cost matrix of the assignment problem: an edge costs minus its weight, a missing edge
+# (and a user with themselves) costs NO_EDGE_VALUE, parallel edges keep the heaviest one
+def assignment_costs(graph):
+    cost = np.full((graph.size, graph.size), float(NO_EDGE_VALUE))
+    keep = graph.src != graph.dst
+    src, dst, weight = graph.src[keep], graph.dst[keep], graph.weight[keep].astype(np.float64)
+    np.minimum.at(cost, (src, dst), -weight)
+    np.minimum.at(cost, (dst, src), -weight)
+    return cost
+
+
+# Best matching of a path of edges with the given weights, more pairs first and then more weight
+# Returns the indices of the chosen edges
+def path_matching(weights):
+    best = [(0, 0), (0, 0)]
+    for w in weights:
+        best.append(max(best[-1], (best[-2][0] + 1, best[-2][1] + w)))
+    chosen = []
+    i = len(weights)
+    while i > 0:
+        if best[i + 1] == best[i]:
+            i -= 1
+        else:
+            chosen.append(i - 1)
+            i -= 2
+    return chosen
+
+
+# The assignment is a set of cycles i -> p[i]. Every cycle is split at its missing edges into paths,
+# a cycle without missing edges leaves out one of its first two edges, and the paths are matched exactly
+def pairs_from_assignment(p, cost):
+    res = []
+    seen = [False] * len(p)
+    for start in range(len(p)):
+        if seen[start]:
+            continue
+        cycle = [start]
+        seen[start] = True
+        while not seen[p[cycle[-1]]]:
+            cycle.append(p[cycle[-1]])
+            seen[cycle[-1]] = True
+        if len(cycle) < 2:
+            continue
+        # Edge t of the cycle goes from cycle[t] to cycle[t + 1]
+        edges = [(cycle[t], cycle[(t + 1) % len(cycle)]) for t in range(len(cycle) if len(cycle) > 2 else 1)]
+        missing = [t for t, (i, j) in enumerate(edges) if cost[i][j] >= NO_EDGE_VALUE]
+        if missing:
+            shift = missing[0] + 1
+            edges = edges[shift:] + edges[:shift]
+            options = [edges]
+        else:
+            options = [edges[1:], edges[2:] + edges[:1]]
+        best = None
+        for option in options:
+            paths = [[]]
+            for i, j in option:
+                if cost[i][j] >= NO_EDGE_VALUE:
+                    paths.append([])
+                else:
+                    paths[-1].append((i, j))
+            chosen = [path[t] for path in paths for t in path_matching([-cost[i][j] for i, j in path])]
+            key = (len(chosen), -sum(cost[i][j] for i, j in chosen))
+            if best is None or key > best[0]:
+                best = (key, chosen)
+        res.extend(best[1])
+    return res
 
 
-# Hungarian algorithm to find the best matching
-# Returns the result as pairs of vertices that are matched
+# Hungarian algorithm on the assignment problem of the graph (EdgeList or list of [i, j, w])
+# The scans over the columns are numpy operations, the cost matrix is dense, so it is meant for a few thousand users
+# The assignment is a set of cycles, they are turned into a matching that is returned with its weight
 def hungarian_algorithm(graph):
-    graph = preprocess_graph(graph)
-    n = len(graph)
-    u = [0] * n
-    v = [0] * n
-    p = [0] * n
-    way = [0] * n
-    for i in range(1, n):
+    graph = as_edge_list(graph)
+    n = graph.size
+    if n == 0 or len(graph) == 0:
+        return [], 0
+    cost = assignment_costs(graph)
+    # Rows and columns are numbered from 1, row and column 0 are the virtual start of every augmenting path
+    u = np.zeros(n + 1)
+    v = np.zeros(n + 1)
+    p = np.zeros(n + 1, dtype=np.int64)
+    way = np.zeros(n + 1, dtype=np.int64)
+    for i in range(1, n + 1):
         p[0] = i
         j0 = 0
-        minv = [INFINITY] * n
-        used = [0] * n
+        minv = np.full(n + 1, np.inf)
+        used = np.zeros(n + 1, dtype=bool)
         while True:
-            used[j0] = 1
+            used[j0] = True
             i0 = p[j0]
-            delta = INFINITY
-            j1 = 0
-            for j in range(1, n):
-                if used[j] == 0:
-                    cur = graph[i0][j] - u[i0] - v[j]
-                    if cur < minv[j]:
-                        minv[j] = cur
-                        way[j] = j0
-                    if minv[j] < delta:
-                        delta = minv[j]
-                        j1 = j
-            for j in range(0, n):
-                if used[j] != 0:
-                    u[p[j]] += delta
-                    v[j] -= delta
-                else:
-                    minv[j] -= delta
+            free = ~used
+            free[0] = False
+            cur = np.full(n + 1, np.inf)
+            cur[1:] = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (cur < minv)
+            minv[better] = cur[better]
+            way[better] = j0
+            j1 = int(np.argmin(np.where(free, minv, np.inf)))
+            delta = minv[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[free] -= delta
             j0 = j1
             if p[j0] == 0:
                 break
@@ -66,18 +146,12 @@ def hungarian_algorithm(graph):
             j0 = j1
             if j0 == 0:
                 break
-    res = []
-    print(p)
-    used = [0] * n
-    for i in range(1, len(p)):
-        if p[i] != 0 and p[i] != i and used[p[i]] == 0 and used[i] == 0:
-            used[i] = 1
-            used[p[i]] = 1
-            res.append([i - 1, p[i] - 1])
-            p[p[i]] = 0
-    print(res)
-    # print(-v[0])
-    return res, -v[0]
+    # p[j] is the row assigned to column j, assignment[i] is the column of row i
+    assignment = [0] * n
+    for j in range(1, n + 1):
+        assignment[p[j] - 1] = j - 1
+    res = pairs_from_assignment(assignment, cost)
+    return res, np.array([-cost[i][j] for i, j in res], dtype=graph.weight.dtype).sum().item()
 
 
 # Function that compares which algorithm finds a better matching
@@ -92,9 +166,161 @@ def compare(graph, f1, f2):
     return cost1 >= cost2
 
 
-# Takes graph (dict where key is user id, and value is a list of user id that are connected)
-# Returns a list of pairs representing new connections for current week
-def create_new_pairs(graph):
+def solve_blossom(graph):
     pairs, weight = blossom_algorithm(graph)
-    # print(pairs)
+    return pairs, weight, weight
+
+
+def solve_approximate(graph, epsilon=EPSILON):
+    stats = dict()
+    pairs, weight = approximate_matching(graph, epsilon, stats)
+    return pairs, weight, stats['upper_bound']
+
+
+def solve_greedy(graph):
+    pairs, weight = greedy(graph)
+    return [(min(i, j), max(i, j)) for i, j in pairs], weight, vertex_bound(graph)
+
+
+def solve_hungarian(graph):
+    pairs, weight = hungarian_algorithm(graph)
+    return [(min(i, j), max(i, j)) for i, j in pairs], weight, vertex_bound(graph)
+
+
+# Solvers by name, each takes a component and returns (pairs, weight, upper bound of the optimal weight)
+# Keyword options of a solver, like the epsilon of approximate, come from the solver_options of create_new_pairs
+SOLVERS = {
+    'blossom': solve_blossom,
+    'approximate': solve_approximate,
+    'greedy': solve_greedy,
+    'hungarian': solve_hungarian,
+}
+
+
+# Name of the solver for a graph of this size
+def choose_solver(nvertex, nedge):
+    if nvertex >= APPROXIMATE_USERS or nedge >= APPROXIMATE_EDGES:
+        return 'approximate'
+    return 'blossom'
+
+
+# Matches every connected component on its own with the given solver, large components in parallel when workers > 1
+# options are the keyword options of the solver
+# Returns (pairs, weight, upper bound) in the units of graph
+def match_components(graph, workers, solver, options=None):
+    solve = partial(SOLVERS[solver], **(options or {}))
+    components = split_components(graph)
+    large = [k for k, (vertices, component) in enumerate(components) if len(component) >= POOL_COMPONENT_EDGES]
+    results = dict()
+    if workers > 1 and len(large) > 1:
+        with ProcessPoolExecutor(min(workers, len(large))) as executor:
+            results = dict(zip(large, executor.map(solve, [components[k][1] for k in large])))
+    pairs = []
+    weight = upper_bound = 0
+    for k, (vertices, component) in enumerate(components):
+        local, component_weight, component_bound = results[k] if k in results else solve(component)
+        vertices = vertices.tolist()
+        pairs.extend((vertices[i], vertices[j]) for i, j in local)
+        weight += component_weight
+        upper_bound += component_bound
+    # Same order as a single blossom_algorithm call gives: by the smaller vertex of the pair
+    pairs.sort()
+    return pairs, weight, upper_bound
+
+
+# Body of the solver process, it sends ('done', result) or ('crashed', error) through the queue
+# The process starts its own process group, which the pool of match_components inherits,
+# so stop_process can stop all of them together
+def match_in_process(queue, graph, workers, solver, options):
+    os.setpgrp()
+    try:
+        message = ('done', match_components(graph, workers, solver, options))
+    except Exception as error:
+        message = ('crashed', repr(error))
+    queue.put(message)
+
+
+# Waits at most timeout seconds for the message of the solver process and returns it, or None if there is none yet
+# A process that died without sending anything, for example killed for its memory, has crashed
+def wait_message(queue, process, timeout):
+    end = time.perf_counter() + timeout
+    while True:
+        try:
+            return queue.get(timeout=max(0, min(1, end - time.perf_counter())))
+        except Empty:
+            if not process.is_alive():
+                try:
+                    return queue.get(timeout=1)
+                except Empty:
+                    return 'crashed', f'exit code {process.exitcode}'
+            if time.perf_counter() >= end:
+                return None
+
+
+# Kills the solver process together with its pool workers
+def stop_process(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        # The process has not started its group yet, so it has no workers either
+        process.kill()
+    process.join()
+
+
+# Runs the solver in its own process, if it takes more than FALLBACK_START of the deadline
+# the fallback solver runs here on one core meanwhile, the solver keeps the other ones
+# Returns (result, name of the solver that gave it, error) where error is None if the solver finished in time,
+# 'deadline' if it was stopped at the deadline, or what it crashed with
+def match_with_deadline(graph, workers, solver, deadline, fallback, solver_options=None):
+    solver_options = solver_options or {}
+    start = time.perf_counter()
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=match_in_process,
+                                      args=(queue, graph, workers, solver, solver_options.get(solver)))
+    process.start()
+    message = wait_message(queue, process, deadline * FALLBACK_START)
+    backup = None
+    if message is None:
+        backup = match_components(graph, 1, fallback, solver_options.get(fallback))
+        message = wait_message(queue, process, deadline - (time.perf_counter() - start))
+    if message is None:
+        stop_process(process)
+        return backup, fallback, 'deadline'
+    process.join()
+    status, result = message
+    if status == 'done':
+        return result, solver, None
+    if backup is None:
+        backup = match_components(graph, workers, fallback, solver_options.get(fallback))
+    return backup, fallback, result
+
+
+# Takes graph (EdgeList or list of [i, j, w] where i and j are indices of users)
+# Returns a list of pairs representing new connections for current week
+# solver is a name from SOLVERS, by default choose_solver picks it from the size of the graph
+# With a deadline in seconds the solver runs in a separate process, and if it does not finish in time or crashes
+# the pairs of the fallback solver are returned instead
+# The solvers get the weights as integers multiplied by scale, so they never take the float code path
+# solver_options maps a solver name to its keyword options, for example {'approximate': {'epsilon': 0.01}},
+# they are used whenever that solver runs, as the chosen one or as the fallback
+# If stats is a dict, the solver that was used, the time it took, whether the deadline was missed, what the solver
+# crashed with (or None), the total weight and an upper bound of the optimal weight (in the original units)
+# are written to it
+def create_new_pairs(graph, workers=1, solver=None, stats=None, scale=WEIGHT_SCALE, deadline=None,
+                     fallback=FALLBACK_SOLVER, solver_options=None):
+    solver_options = solver_options or {}
+    start = time.perf_counter()
+    graph = as_edge_list(graph).scaled(scale)
+    if solver is None:
+        solver = choose_solver(graph.size, len(graph))
+    used, error = solver, None
+    if deadline is None or solver == fallback:
+        pairs, weight, upper_bound = match_components(graph, workers, solver, solver_options.get(solver))
+    else:
+        (pairs, weight, upper_bound), used, error = match_with_deadline(graph, workers, solver, deadline, fallback,
+                                                                        solver_options)
+    if stats is not None:
+        stats.update(solver=used, seconds=time.perf_counter() - start, missed_deadline=error == 'deadline',
+                     solver_error=error if error != 'deadline' else None, weight=weight / scale,
+                     upper_bound=upper_bound / scale)
     return pairs
@@ -0,0 +1,99 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from scoring import CloseRelation, ProfileEncoding, score_pairs
+
+# Number of processes used to score the candidate pairs
+WORKERS = os.cpu_count() or 1
+
+# Every worker gets a few row blocks, so a slow block does not hold the others back
+BLOCKS_PER_WORKER = 4
+
+# Shared memory block, the arrays in it and the encoding built on top of them, one per worker process
+worker_memory = None
+worker_arrays = None
+worker_encoding = None
+
+
+# Flattens the encoding into named arrays, layout tells how to put them together again
+def encoding_arrays(encoding):
+    arrays = dict()
+    layout = []
+    for kind, fields in (('fields', encoding.fields), ('lists', encoding.lists)):
+        for ind, (key, coefficient, codes, close) in enumerate(fields):
+            name = f'{kind}{ind}'
+            arrays[name + 'codes'] = codes
+            arrays[name + 'first'] = close.first
+            arrays[name + 'second'] = close.second
+            if close.matrix is not None:
+                arrays[name + 'matrix'] = close.matrix
+            else:
+                arrays[name + 'keys'] = close.keys
+            layout.append((kind, name, key, coefficient, close.size))
+    return arrays, layout
+
+
+def rebuild_encoding(size, arrays, layout):
+    encoding = ProfileEncoding([])
+    encoding.size = size
+    encoding.fields = []
+    encoding.lists = []
+    for kind, name, key, coefficient, close_size in layout:
+        close = CloseRelation(close_size, arrays[name + 'first'], arrays[name + 'second'],
+                              arrays.get(name + 'matrix'), arrays.get(name + 'keys'))
+        getattr(encoding, kind).append((key, coefficient, arrays[name + 'codes'], close))
+    return encoding
+
+
+# Copies the arrays into one shared memory block, returns the block and where every array lives in it
+def share_arrays(arrays):
+    manifest = []
+    offset = 0
+    for name, array in arrays.items():
+        manifest.append((name, array.dtype.str, array.shape, offset))
+        offset += (array.nbytes + 63) // 64 * 64
+    memory = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for (name, dtype, shape, start), array in zip(manifest, arrays.values()):
+        np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=start)[...] = array
+    return memory, manifest
+
+
+def attach_arrays(memory, manifest):
+    return {name: np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=start)
+            for name, dtype, shape, start in manifest}
+
+
+def init_worker(memory_name, manifest, size, layout):
+    global worker_memory, worker_arrays, worker_encoding
+    worker_memory = shared_memory.SharedMemory(name=memory_name)
+    worker_arrays = attach_arrays(worker_memory, manifest)
+    worker_encoding = rebuild_encoding(size, worker_arrays, layout)
+
+
+# Scores the candidate pairs start..stop-1 and sends back only the compact edge arrays
+def score_block(start, stop):
+    return score_pairs(worker_encoding, worker_arrays['src'][start:stop], worker_arrays['dst'][start:stop])
+
+
+# Same result as scoring.score_pairs, but the candidates are split into row blocks scored by a process pool
+# The encoding and the candidates are put into shared memory once instead of being pickled for every block,
+# and the blocks are merged in row order, so the output does not depend on the number of workers
+def score_pairs_parallel(encoding, src, dst, workers=WORKERS):
+    blocks = min(workers * BLOCKS_PER_WORKER, max(encoding.size, 1))
+    rows = np.linspace(0, encoding.size, blocks + 1).astype(np.int64)
+    bounds = np.searchsorted(src, rows).tolist()
+    arrays, layout = encoding_arrays(encoding)
+    arrays['src'] = src
+    arrays['dst'] = dst
+    memory, manifest = share_arrays(arrays)
+    try:
+        with ProcessPoolExecutor(workers, initializer=init_worker,
+                                 initargs=(memory.name, manifest, encoding.size, layout)) as executor:
+            results = list(executor.map(score_block, bounds[:-1], bounds[1:]))
+    finally:
+        memory.close()
+        memory.unlink()
+    return tuple(np.concatenate([result[k] for result in results]) for k in range(3))
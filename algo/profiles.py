@@ -0,0 +1,57 @@
+import sys
+
+from config import MAX_DISTANCE
+from distance import normalize_string
+from fuzzy import DeletionIndex
+
+
+# Fields of a user document that the matching reads, everything else is not fetched
+USER_FIELDS = ['is_active', 'year', 'description', 'major', 'interests', 'degree', 'country']
+
+
+# Matching fields of one user, normalized and interned once per run
+# Fields that are missing in the document are stored as None
+# interest_neighbours[k] is the set of all interests in the pool that are close to interests[k]
+class Profile:
+    __slots__ = ('year', 'description', 'major', 'interests', 'degree', 'country', 'interest_neighbours')
+
+    def __init__(self, year=None, description=None, major=None, interests=None, degree=None, country=None):
+        self.year = year
+        self.description = description
+        self.major = major
+        self.interests = interests
+        self.degree = degree
+        self.country = country
+        self.interest_neighbours = None
+
+
+def normalize_value(value):
+    if value is None:
+        return None
+    return sys.intern(normalize_string(value))
+
+
+# Builds a profile from the raw firestore dict, everything that is not used for matching is dropped
+def make_profile(data):
+    interests = data.get('interests')
+    return Profile(
+        year=normalize_value(data.get('year')),
+        description=normalize_value(data.get('description')),
+        major=normalize_value(data.get('major')),
+        interests=None if interests is None else tuple(normalize_value(interest) for interest in interests),
+        degree=normalize_value(data.get('degree')),
+        country=normalize_value(data.get('country')),
+    )
+
+
+# Resolves every distinct interest of the pool once to the interests within MAX_DISTANCE['interests']
+# Profiles with the same interest share the same neighbour set
+# The distance decisions go through cache when it is given
+def resolve_interests(profiles, cache=None):
+    vocabulary = {interest for profile in profiles for interest in profile.interests or ()}
+    within = cache.checker('interests', MAX_DISTANCE['interests']) if cache else None
+    index = DeletionIndex(vocabulary, MAX_DISTANCE['interests'], within)
+    neighbours = {interest: index.lookup(interest) for interest in vocabulary}
+    for profile in profiles:
+        if profile.interests is not None:
+            profile.interest_neighbours = tuple(neighbours[interest] for interest in profile.interests)
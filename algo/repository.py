@@ -0,0 +1,143 @@
+import time
+from datetime import datetime, timezone
+
+from config import BATCH_SIZE, PAGE_SIZE
+from history import KINDS, HistoryRollup, feedback_open_since
+from profiles import USER_FIELDS
+
+# A repository gives make_pairs the users and the history and takes the new pairs:
+#   get_users() - documents (with id and to_dict()) of the active users, only USER_FIELDS
+#   get_history() - a HistoryRollup with all the history
+#   update(pairs, stats) - stores the pairs of this run and then sets the send flag of the matching config
+# database.FirestoreRepository is the real one, MemoryRepository keeps everything in memory
+
+
+# History of one run is a week document with the stats and a PAIRS_COLLECTION of pair documents under it,
+# so the feedback of one pair is a write to its own document and a week has no size limit
+PAIRS_COLLECTION = "pairs"
+
+
+# The week document of one run: the number of pairs and, if stats is given, how they were found
+def week_document(pairs, stats=None, timestamp=None):
+    document = {
+        'timestamp': timestamp,
+        'pairs_count': len(pairs),
+    }
+    if stats is not None:
+        document["matching"] = {
+            "solver": stats["solver"],
+            "seconds": stats["seconds"],
+            "missed_deadline": stats["missed_deadline"],
+            "solver_error": stats["solver_error"],
+            "weight": stats["weight"],
+        }
+    return document
+
+
+# Id of the pair document, the bot finds the pair of two users by it without reading the week
+def pair_id(user1, user2):
+    return f"{user1}_{user2}"
+
+
+# The pair documents of one run by their ids, without feedback
+def pair_documents(pairs):
+    return {
+        pair_id(pair[0], pair[1]): {
+            "user1_id": pair[0],
+            "user1_isLike": 0,
+            "user2_id": pair[1],
+            "user2_isLike": 0,
+            "meeting_happened": None,
+        }
+        for pair in pairs
+    }
+
+
+# The writes of a run as batches of at most batch_size operations, the week document is in the first one
+# Every write is (pair id, document), the pair id of the week document is None
+def week_batches(pairs, stats=None, timestamp=None, batch_size=BATCH_SIZE):
+    writes = [(None, week_document(pairs, stats, timestamp))] + list(pair_documents(pairs).items())
+    return [writes[start:start + batch_size] for start in range(0, len(writes), batch_size)]
+
+
+# Read-only document with the interface of a firestore snapshot
+class Document:
+    def __init__(self, id, data):
+        self.id = id
+        self.data = data
+
+    def to_dict(self):
+        return dict(self.data)
+
+    def get(self, field):
+        return self.data.get(field)
+
+
+# Users, history, rollup and config kept in memory, so make_pairs runs without firestore credentials
+# It reads and writes the same way the firestore repository does, and every request it would send
+# (a page of reads, a batch of writes, a single document) waits latency seconds and is counted in requests
+class MemoryRepository:
+    def __init__(self, users=None, latency=0, page_size=PAGE_SIZE):
+        self.users = dict(users or {})
+        # history[i] is the week document of run i and history_pairs[i] its pair documents by id
+        self.history = []
+        self.history_pairs = []
+        self.rollup = dict()
+        self.watermark = None
+        self.config = {'send': False}
+        self.latency = latency
+        self.page_size = page_size
+        self.requests = 0
+
+    def request(self, count=1):
+        self.requests += count
+        if self.latency:
+            time.sleep(self.latency * count)
+
+    # Requests needed to read count documents page by page, the last page is the first one that is not full
+    def read(self, count):
+        self.request(count // self.page_size + 1)
+
+    def get_users(self):
+        users = [
+            Document(user, {field: data[field] for field in USER_FIELDS if field in data})
+            for user, data in sorted(self.users.items())
+            if data.get('is_active') is True
+        ]
+        self.read(len(users))
+        return users
+
+    def get_history(self):
+        self.read(len(self.rollup))
+        self.request()
+        rollup = HistoryRollup({user: {kind: set(sets[kind]) for kind in KINDS} for user, sets in self.rollup.items()},
+                               self.watermark, feedback_open_since())
+        weeks = [ind for ind, document in enumerate(self.history)
+                 if self.watermark is None or document['timestamp'] > self.watermark]
+        self.request()
+        for ind in weeks:
+            self.read(len(self.history_pairs[ind]))
+            rollup.merge_week(self.history_pairs[ind].values(), self.history[ind]['timestamp'])
+        changed = sorted(rollup.changed)
+        for start in range(0, len(changed), BATCH_SIZE):
+            self.request()
+            for user in changed[start:start + BATCH_SIZE]:
+                self.rollup[user] = {kind: set(rollup.users[user][kind]) for kind in KINDS}
+        if rollup.watermark is not None:
+            self.request()
+            self.watermark = rollup.watermark
+        rollup.changed = set()
+        return rollup
+
+    def update(self, pairs, stats=None):
+        self.history.append(None)
+        self.history_pairs.append(dict())
+        for batch in week_batches(pairs, stats, datetime.now(timezone.utc)):
+            self.request()
+            for id, document in batch:
+                if id is None:
+                    self.history[-1] = document
+                else:
+                    self.history_pairs[-1][id] = document
+        self.request()
+        self.config['send'] = True
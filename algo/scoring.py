@@ -0,0 +1,128 @@
+import numpy as np
+
+from config import MATCH_VALUE, MATCH_COEFFICIENTS, MAX_DISTANCE
+from fuzzy import close_value_pairs
+
+# Number of user pairs that are scored at once
+BLOCK_SIZE = 1 << 16
+
+# Vocabularies up to this size keep their close relation as a dense boolean matrix
+DENSE_VOCABULARY = 4096
+
+
+# Gives every distinct value an integer code, missing values get the code -1
+# The values come from the profile table, so they are already normalized
+def encode_values(values):
+    vocabulary = dict()
+    codes = np.full(len(values), -1, dtype=np.int32)
+    for ind, value in enumerate(values):
+        if value is not None:
+            codes[ind] = vocabulary.setdefault(value, len(vocabulary))
+    return codes, list(vocabulary)
+
+
+# Same as encode_values but for list fields, every row is padded with -1 up to the longest list
+def encode_lists(lists):
+    vocabulary = dict()
+    width = max([len(values) for values in lists if values is not None], default=0)
+    codes = np.full((len(lists), width), -1, dtype=np.int32)
+    for ind, values in enumerate(lists):
+        for pos, value in enumerate(values or []):
+            codes[ind, pos] = vocabulary.setdefault(value, len(vocabulary))
+    return codes, list(vocabulary)
+
+
+# Tells which codes of a vocabulary are close enough, every code is close to itself and -1 is close to nothing
+# first and second hold the close pairs of distinct codes with first < second
+class CloseRelation:
+    def __init__(self, size, first, second, matrix=None, keys=None):
+        self.size = size
+        self.first = first
+        self.second = second
+        self.matrix = matrix
+        self.keys = keys
+        if matrix is not None or keys is not None:
+            return
+        if size <= DENSE_VOCABULARY:
+            # The last row and column stay empty, so the code -1 is never close to anything
+            self.matrix = np.zeros((size + 1, size + 1), dtype=bool)
+            self.matrix[np.arange(size), np.arange(size)] = True
+            self.matrix[first, second] = True
+            self.matrix[second, first] = True
+        else:
+            self.keys = np.sort(np.concatenate([first * size + second, second * size + first]))
+
+    def lookup(self, a, b):
+        if self.matrix is not None:
+            return self.matrix[a, b]
+        a, b = np.broadcast_arrays(a, b)
+        valid = (a >= 0) & (b >= 0)
+        found = (a == b) & valid
+        if len(self.keys):
+            keys = a.astype(np.int64) * self.size + b
+            pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+            found |= (self.keys[pos] == keys) & valid
+        return found
+
+
+# Every field of MATCH_COEFFICIENTS encoded once as integer codes together with its close relation
+# The distance decisions go through cache when it is given
+class ProfileEncoding:
+    def __init__(self, profiles, cache=None):
+        self.size = len(profiles)
+        self.cache = cache
+        self.fields = []
+        self.lists = []
+        for key, coefficient in MATCH_COEFFICIENTS.items():
+            values = [getattr(profile, key) for profile in profiles]
+            if key == 'interests':
+                codes, vocabulary = encode_lists(values)
+                self.lists.append((key, coefficient, codes, self.interest_relation(profiles, vocabulary)))
+            else:
+                codes, vocabulary = encode_values(values)
+                self.fields.append((key, coefficient, codes, self.close_relation(vocabulary, key)))
+
+    def close_relation(self, vocabulary, key):
+        within = self.cache.checker(key, MAX_DISTANCE[key]) if self.cache else None
+        first, second = close_value_pairs(vocabulary, MAX_DISTANCE[key], within)
+        return CloseRelation(len(vocabulary), first, second)
+
+    # Interests were already resolved to their neighbours in the profile table, so no distances are computed here
+    def interest_relation(self, profiles, vocabulary):
+        codes = {value: code for code, value in enumerate(vocabulary)}
+        neighbours = dict()
+        for profile in profiles:
+            neighbours.update(zip(profile.interests or (), profile.interest_neighbours or ()))
+        pairs = [(codes[a], codes[b]) for a in vocabulary for b in neighbours[a] if codes[a] < codes[b]]
+        first = np.array([a for a, b in pairs], dtype=np.int64)
+        second = np.array([b for a, b in pairs], dtype=np.int64)
+        return CloseRelation(len(vocabulary), first, second)
+
+
+# Weights of the user pairs (src[k], dst[k]), computed with broadcasting over the field codes
+def pair_weights(encoding, src, dst):
+    weights = np.zeros(len(src), dtype=np.int64)
+    for key, coefficient, codes, close in encoding.fields:
+        weights += coefficient * close.lookup(codes[src], codes[dst])
+    for key, coefficient, codes, close in encoding.lists:
+        for s in range(codes.shape[1]):
+            for t in range(codes.shape[1]):
+                weights += coefficient * close.lookup(codes[src, s], codes[dst, t])
+    return weights
+
+
+# Scores the candidate pairs block by block and returns the ones that reach MATCH_VALUE as arrays
+# The pairs are expected in row-major order, so the edges come out in the same order as in graph_builder
+def score_pairs(encoding, src, dst):
+    edges_src = [np.zeros(0, dtype=src.dtype)]
+    edges_dst = [np.zeros(0, dtype=dst.dtype)]
+    edges_weight = [np.zeros(0, dtype=np.int64)]
+    for start in range(0, len(src), BLOCK_SIZE):
+        block_src = src[start:start + BLOCK_SIZE]
+        block_dst = dst[start:start + BLOCK_SIZE]
+        weights = pair_weights(encoding, block_src, block_dst)
+        mask = weights >= MATCH_VALUE
+        edges_src.append(block_src[mask])
+        edges_dst.append(block_dst[mask])
+        edges_weight.append(weights[mask])
+    return np.concatenate(edges_src), np.concatenate(edges_dst), np.concatenate(edges_weight)
@@ -0,0 +1,120 @@
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import matching
+from edges import EdgeList
+
+# Folder where make_pairs keeps the snapshots of the last SNAPSHOT_KEEP runs when they are turned on
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots')
+SNAPSHOT_KEEP = 8
+SUFFIX = '.ccsnap'
+
+MAGIC = b'CCSNAP'
+VERSION = 1
+
+# Every array starts at a multiple of this, so it can be used straight from the mapped file
+ALIGNMENT = 64
+
+
+# New file name in directory, names sort in the order of the runs
+def snapshot_path(directory=SNAPSHOT_DIR):
+    name = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S-%f')
+    path = os.path.join(directory, name + SUFFIX)
+    count = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f'{name}-{count}{SUFFIX}')
+        count += 1
+    return path
+
+
+# Removes all snapshots in directory but the newest keep
+def prune_snapshots(directory=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP):
+    names = sorted(name for name in os.listdir(directory) if name.endswith(SUFFIX))
+    for name in names[:max(len(names) - keep, 0)]:
+        os.remove(os.path.join(directory, name))
+
+
+# Saves the graph of a run in directory and drops the old snapshots, returns the path of the new one
+def save_run(graph, users_ind, profile_hashes, directory=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP):
+    path = snapshot_path(directory)
+    save_snapshot(path, graph, users_ind, profile_hashes)
+    prune_snapshots(directory, keep)
+    return path
+
+
+def aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+# Layout: MAGIC, version (uint16), header length (uint32), json header, padding, arrays
+# The header lists every array with its dtype, shape and offset from the start of the file
+def save_snapshot(path, graph, users_ind, profile_hashes):
+    starts, ends = graph.adjacency()
+    arrays = {
+        'src': graph.src,
+        'dst': graph.dst,
+        'weight': graph.weight,
+        'adjacency_starts': starts,
+        'adjacency_ends': ends,
+        'users_ind': np.array(users_ind, dtype=str),
+        'profile_hashes': np.asarray(profile_hashes, dtype=np.int64),
+    }
+    header = {'size': graph.size, 'created': datetime.now(timezone.utc).isoformat(), 'arrays': []}
+    # The offsets depend on the header length, so the header is built until its length stops changing
+    header_length = 0
+    while True:
+        offset = aligned(len(MAGIC) + 6 + header_length)
+        header['arrays'] = []
+        for name, array in arrays.items():
+            header['arrays'].append({'name': name, 'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset})
+            offset = aligned(offset + array.nbytes)
+        encoded = json.dumps(header).encode()
+        if len(encoded) == header_length:
+            break
+        header_length = len(encoded)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(MAGIC + np.uint16(VERSION).tobytes() + np.uint32(header_length).tobytes() + encoded)
+        for description, array in zip(header['arrays'], arrays.values()):
+            file.write(b'\0' * (description['offset'] - file.tell()))
+            file.write(np.ascontiguousarray(array).tobytes())
+
+
+# Maps the file and returns (graph, users_ind, profile_hashes), the arrays are views of the mapped file
+def load_snapshot(path):
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError(f'{path} is not a graph snapshot')
+    version = int(data[len(MAGIC):len(MAGIC) + 2].view(np.uint16)[0])
+    if version != VERSION:
+        raise ValueError(f'Snapshot version {version} is not supported, expected {VERSION}')
+    header_length = int(data[len(MAGIC) + 2:len(MAGIC) + 6].view(np.uint32)[0])
+    header = json.loads(bytes(data[len(MAGIC) + 6:len(MAGIC) + 6 + header_length]))
+    arrays = dict()
+    for description in header['arrays']:
+        dtype = np.dtype(description['dtype'])
+        count = int(np.prod(description['shape']))
+        start = description['offset']
+        arrays[description['name']] = data[start:start + count * dtype.itemsize].view(dtype).reshape(description['shape'])
+    graph = EdgeList(arrays['src'], arrays['dst'], arrays['weight'], header['size'])
+    graph.adjacency_cache = (arrays['adjacency_starts'], arrays['adjacency_ends'])
+    return graph, arrays['users_ind'], arrays['profile_hashes']
+
+
+# Runs the matching of a saved run again without touching firestore
+def replay(path):
+    graph, users_ind, profile_hashes = load_snapshot(path)
+    start = time.perf_counter()
+    pairs = matching.create_new_pairs(graph)
+    elapsed = time.perf_counter() - start
+    return [(str(users_ind[i]), str(users_ind[j])) for i, j in pairs], elapsed
+
+
+if __name__ == "__main__":
+    pairs, elapsed = replay(sys.argv[1])
+    print(f"{len(pairs)} pairs in {elapsed:.3f}s")
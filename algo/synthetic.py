@@ -0,0 +1,150 @@
+import random
+import string
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import accumulate
+
+from repository import MemoryRepository, pair_documents
+
+MAJORS = ['Computer Science', 'Mathematics', 'Applied Mathematics', 'Physics', 'Economics', 'Data Science',
+          'Biology', 'Chemistry', 'Electrical Engineering', 'Mechanical Engineering', 'Business Administration',
+          'Psychology', 'Linguistics', 'Philosophy', 'Political Science', 'Architecture', 'Medicine', 'Law',
+          'History', 'Neuroscience']
+COUNTRIES = ['Germany', 'France', 'Spain', 'Italy', 'Russia', 'India', 'China', 'Brazil', 'Turkey', 'Poland',
+             'Ukraine', 'Mexico', 'Egypt', 'Iran', 'Pakistan', 'Vietnam', 'Indonesia', 'Nigeria', 'Kazakhstan',
+             'Greece', 'Portugal', 'Netherlands', 'Austria', 'Syria', 'Morocco', 'Colombia', 'Japan', 'Korea',
+             'Bangladesh', 'Romania']
+INTERESTS = ['music', 'sports', 'books', 'travel', 'chess', 'hiking', 'cooking', 'movies', 'photography', 'dancing',
+             'gaming', 'painting', 'running', 'yoga', 'swimming', 'theatre', 'startups', 'languages', 'cycling', 'jazz',
+             'football', 'basketball', 'tennis', 'climbing', 'skiing', 'anime', 'poetry', 'history', 'astronomy',
+             'politics', 'fashion', 'volunteering', 'board games', 'programming', 'robotics', 'gardening',
+             'meditation', 'podcasts', 'singing', 'guitar']
+DEGREES = ['Bachelor', 'Masters', 'PhD']
+YEARS = ['1', '2', '3', '4']
+WORDS = ['i', 'love', 'like', 'student', 'friends', 'new', 'people', 'city', 'coffee', 'walks', 'music', 'study',
+         'looking', 'for', 'and', 'the', 'to', 'meet', 'good', 'conversations', 'games', 'weekend', 'learning',
+         'second', 'year', 'from', 'here', 'nature', 'art', 'science']
+
+# Number of distinct majors, countries, interests and description words,
+# the lists above are extended with made up names
+# With these sizes about 1.2% of the user pairs get an edge, mostly from the country, the major and the interests,
+# so a pool of 50000 users has about 12 million pairs to match
+MAJOR_COUNT = 400
+COUNTRY_COUNT = 190
+INTEREST_COUNT = 1000
+WORD_COUNT = 2000
+
+# Skew of the description words, like in natural text
+WORD_SKEW = 1.0
+
+# Largest number of interests of a user
+MAX_INTERESTS = 3
+
+# How uneven the vocabularies are: the k-th most popular value is chosen with weight 1 / k ** SKEW,
+# 0 makes all values equally likely
+SKEW = 0.3
+
+# Share of the majors, countries and interests written with one typo
+TYPO_RATE = 0.05
+
+# Smallest and largest number of words in a description
+DESCRIPTION_WORDS = (3, 30)
+
+# Share of the users that paused matching
+INACTIVE_SHARE = 0.1
+
+# Weeks of history, the share of the pairs that met and the share of the users that liked the meeting
+WEEKS = 4
+MEETING_RATE = 0.6
+LIKE_RATE = 0.7
+
+# Timestamp of the first week of history
+FIRST_WEEK = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def zipf_weights(size, skew=SKEW):
+    return [1 / (k + 1) ** skew for k in range(size)]
+
+
+# The first size words, with made up ones after the given ones, and their cumulative weights
+# The made up words are the same for every run and too far apart to be close to each other
+@lru_cache(maxsize=None)
+def vocabulary(words, size, skew=SKEW):
+    rng = random.Random(size)
+    words = list(words[:size])
+    while len(words) < size:
+        words.append(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(6, 12))).capitalize())
+    return words, list(accumulate(zipf_weights(size, skew)))
+
+
+# The word with one letter replaced, removed or doubled
+def typo(word, rng):
+    k = rng.randrange(len(word))
+    change = rng.randrange(3)
+    if change == 0:
+        return word[:k] + rng.choice(string.ascii_lowercase) + word[k + 1:]
+    if change == 1 and len(word) > 1:
+        return word[:k] + word[k + 1:]
+    return word[:k] + word[k] + word[k:]
+
+
+def choose(rng, words, typo_rate=TYPO_RATE):
+    word = rng.choices(words[0], cum_weights=words[1])[0]
+    return typo(word, rng) if rng.random() < typo_rate else word
+
+
+# Profile of one user with all the fields the bot stores
+def random_profile(rng=random, skew=SKEW, majors=MAJOR_COUNT, countries=COUNTRY_COUNT, interests=INTEREST_COUNT,
+                   max_interests=MAX_INTERESTS, typo_rate=TYPO_RATE, description_words=DESCRIPTION_WORDS):
+    interest_words = vocabulary(tuple(INTERESTS), interests, skew)
+    words = vocabulary(tuple(WORDS), WORD_COUNT, WORD_SKEW)
+    return {
+        'full_name': 'Name',
+        'photo': 'photo',
+        'major': choose(rng, vocabulary(tuple(MAJORS), majors, skew), typo_rate),
+        'degree': rng.choice(DEGREES),
+        'year': rng.choice(YEARS),
+        'country': choose(rng, vocabulary(tuple(COUNTRIES), countries, skew), typo_rate),
+        'interests': sorted({choose(rng, interest_words, typo_rate) for _ in range(rng.randint(0, max_interests))}),
+        'description': ' '.join(choose(rng, words, 0) for _ in range(rng.randint(*description_words))),
+        'is_active': True,
+    }
+
+
+# n users by their ids, with the profile options of random_profile
+def random_users(n, rng=random, inactive_share=INACTIVE_SHARE, **options):
+    users = dict()
+    for i in range(n):
+        user = str(1000000 + i)
+        users[user] = random_profile(rng, **options)
+        users[user]['tg_id'] = user
+        users[user]['is_active'] = rng.random() >= inactive_share
+    return users
+
+
+# Pair documents of weeks of history by their ids, every week pairs up the shuffled users in order
+# and fills the feedback with the given rates
+def random_weeks(users, weeks=WEEKS, rng=random, meeting_rate=MEETING_RATE, like_rate=LIKE_RATE):
+    history = []
+    for _ in range(weeks):
+        pool = sorted(users)
+        rng.shuffle(pool)
+        pairs = pair_documents(list(zip(pool[0::2], pool[1::2])))
+        for pair in pairs.values():
+            pair['meeting_happened'] = rng.random() < meeting_rate
+            if pair['meeting_happened']:
+                pair['user1_isLike'] = 1 if rng.random() < like_rate else -1
+                pair['user2_isLike'] = 1 if rng.random() < like_rate else -1
+        history.append(pairs)
+    return history
+
+
+# MemoryRepository with n synthetic users and weeks of their history, the same seed gives the same repository
+def synthetic_repository(n, weeks=WEEKS, seed=0, latency=0, meeting_rate=MEETING_RATE, like_rate=LIKE_RATE,
+                         **options):
+    rng = random.Random(seed)
+    repository = MemoryRepository(random_users(n, rng, **options), latency)
+    for week, pairs in enumerate(random_weeks(repository.users, weeks, rng, meeting_rate, like_rate)):
+        repository.history.append({'timestamp': FIRST_WEEK + timedelta(weeks=week), 'pairs_count': len(pairs)})
+        repository.history_pairs.append(pairs)
+    return repository
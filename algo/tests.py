@@ -1,9 +1,67 @@
+import datetime
+import io
+import json
+import os
 import random
+import tempfile
+import time
 import unittest
+from contextlib import redirect_stdout
+from unittest import mock
 
-from matching import greedy, compare
+import numpy as np
+
+import matching
+from matching import greedy, compare, create_new_pairs, hungarian_algorithm
+from approximate import approximate_matching
 from blossom import blossom_algorithm
 from brute_force import brute_force_algorithm
+from components import connected_components
+from edges import EdgeList
+from graph_builder import build_initial_graph, build_initial_graph_reference, build_graph, are_close
+from config import FEEDBACK_DAYS
+from history import HistoryIndex, HistoryRollup
+from scoring import ProfileEncoding
+from candidates import candidate_pairs
+from distance import levenshtein_distance, bounded_levenshtein
+from profiles import make_profile, resolve_interests
+from fuzzy import DeletionIndex
+from distance_cache import DistanceCache
+from edge_store import EdgeStore
+from snapshot import load_snapshot, replay, save_run
+from repository import MemoryRepository, week_batches
+from make_pairs import make_pairs
+from synthetic import synthetic_repository
+from benchmark import STAGES, scaling_run
+
+
+class Document:
+    def __init__(self, id, data):
+        self.id = id
+        self.data = data
+
+    def to_dict(self):
+        return dict(self.data)
+
+
+# Solvers for the deadline tests, they run in other processes, so they are module functions
+def crashing_solver(graph):
+    raise ValueError('broken solver')
+
+
+def sleeping_solver(graph, directory):
+    with open(os.path.join(directory, str(os.getpid())), 'w'):
+        pass
+    time.sleep(60)
+
+
+# False for processes that are gone or zombies
+def process_alive(pid):
+    try:
+        with open(f'/proc/{pid}/stat') as file:
+            return file.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
 
 
 class TestBlossomAlgorithm(unittest.TestCase):
@@ -59,6 +117,144 @@ class TestBlossomAlgorithm(unittest.TestCase):
         print(f"Blossom algorithm found a bigger matching in {(more_pairs / num * 100):0,.2f}% cases")
         print(f"Blossom algorithm outperformed greedy by {(cnt / sm * 100):0,.2f}%")
 
+    def test_compare_with_hungarian(self):
+        for _ in range(100):
+            edges = self.generate_graph(1, 40)
+            output = io.StringIO()
+            with redirect_stdout(output):
+                pairs, weight = hungarian_algorithm(edges)
+            self.assertEqual(output.getvalue(), '')
+            weights = {(i, j): w for i, j, w in edges}
+            vertices = [v for pair in pairs for v in pair]
+            self.assertEqual(len(vertices), len(set(vertices)))
+            self.assertEqual(sum(weights[min(pair), max(pair)] for pair in pairs), weight)
+            self.assertTrue(compare(edges, blossom_algorithm, hungarian_algorithm))
+
+    def test_edge_list_input(self):
+        for _ in range(100):
+            edges = self.generate_graph(10, 40)
+            self.assertEqual(blossom_algorithm(EdgeList.from_lists(edges)), blossom_algorithm(edges))
+            self.assertEqual(greedy(EdgeList.from_lists(edges)), greedy(edges))
+
+    def test_warm_start(self):
+        for _ in range(200):
+            edges = self.generate_graph(2, 40)
+            stats = dict()
+            pairs, weight = blossom_algorithm(edges, stats=stats)
+            changed = [[i, j, random.randint(1, 100) if random.randint(1, 10) == 1 else w] for i, j, w in edges]
+            _, expected = blossom_algorithm(changed)
+            n = max(max(i, j) for i, j, w in edges) + 1
+            starts = [
+                (greedy(changed)[0], None),
+                (pairs, stats['duals']),
+                (None, stats['duals']),
+                ([(random.randrange(n), random.randrange(n)) for _ in range(n)], [random.randint(-50, 200) for _ in range(n)]),
+            ]
+            for init_matching, init_duals in starts:
+                self.assertEqual(blossom_algorithm(changed, init_matching, init_duals)[1], expected)
+
+    def test_components(self):
+        # Send every component with at least 10 edges to the process pool
+        pool_edges = matching.POOL_COMPONENT_EDGES
+        matching.POOL_COMPONENT_EDGES = 10
+        self.addCleanup(setattr, matching, 'POOL_COMPONENT_EDGES', pool_edges)
+        for _ in range(50):
+            # A few random graphs side by side, some of their vertices left without edges
+            edges = []
+            offset = 0
+            for part in range(random.randint(1, 5)):
+                graph = self.generate_graph(2, 15)
+                edges.extend([i + offset, j + offset, w] for i, j, w in graph if random.randint(1, 3) > 1)
+                offset += max(max(i, j) for i, j, w in graph) + 1
+            graph = EdgeList.from_lists(edges, offset)
+            labels = connected_components(graph).tolist()
+            for i, j, w in edges:
+                self.assertEqual(labels[i], labels[j])
+            pairs, weight = blossom_algorithm(graph)
+            for workers in (1, 2):
+                found = create_new_pairs(graph, workers)
+                self.assertEqual(sum(w for i, j, w in edges if (i, j) in found or (j, i) in found), weight)
+                self.assertEqual(len(found), len(pairs))
+                self.assertEqual(found, sorted(found))
+
+    def test_scaled_weights(self):
+        for _ in range(100):
+            edges = [[i, j, w / 2] for i, j, w in self.generate_graph(2, 30)]
+            pairs, weight = blossom_algorithm(edges)
+            stats = dict()
+            found = create_new_pairs(edges, stats=stats)
+            self.assertEqual(stats['weight'], weight)
+            self.assertEqual(len(found), len(pairs))
+            self.assertEqual(EdgeList.from_lists(edges).scaled(2).weight.dtype, np.int64)
+
+    def test_solver_deadline(self):
+        edges = self.generate_graph(300, 300)
+        stats = dict()
+        pairs = create_new_pairs(edges, solver='blossom', stats=stats, deadline=0, fallback='greedy')
+        self.assertEqual(stats['solver'], 'greedy')
+        self.assertTrue(stats['missed_deadline'])
+        self.assertEqual(pairs, sorted(tuple(pair) for pair in greedy(EdgeList.from_lists(edges).scaled(2))[0]))
+        pairs = create_new_pairs(edges, solver='blossom', stats=stats, deadline=600, fallback='greedy')
+        self.assertEqual(stats['solver'], 'blossom')
+        self.assertFalse(stats['missed_deadline'])
+        self.assertEqual(pairs, create_new_pairs(edges))
+        for solver in matching.SOLVERS:
+            self.assertLessEqual(len(create_new_pairs(edges, solver=solver, stats=stats)), len(pairs))
+            self.assertEqual(stats['solver'], solver)
+
+    @unittest.skipUnless(os.path.exists('/proc'), 'reads the process table from /proc')
+    def test_deadline_stops_solver_pool(self):
+        pool_edges = matching.POOL_COMPONENT_EDGES
+        matching.POOL_COMPONENT_EDGES = 1
+        self.addCleanup(setattr, matching, 'POOL_COMPONENT_EDGES', pool_edges)
+        solvers = mock.patch.dict(matching.SOLVERS, {'sleep': sleeping_solver, 'crash': crashing_solver})
+        solvers.start()
+        self.addCleanup(solvers.stop)
+        # Three components, so the solver process starts a pool of three workers
+        edges = [[0, 1, 5], [1, 2, 3], [3, 4, 5], [4, 5, 1], [6, 7, 2], [7, 8, 2]]
+        with tempfile.TemporaryDirectory() as directory:
+            stats = dict()
+            start = time.perf_counter()
+            pairs = create_new_pairs(edges, workers=3, solver='sleep', stats=stats, deadline=3, fallback='greedy',
+                                     solver_options={'sleep': {'directory': directory}})
+            self.assertLess(time.perf_counter() - start, 30)
+            self.assertEqual(stats['solver'], 'greedy')
+            self.assertTrue(stats['missed_deadline'])
+            self.assertIsNone(stats['solver_error'])
+            self.assertEqual(pairs, create_new_pairs(edges, solver='greedy'))
+            pids = [int(name) for name in os.listdir(directory)]
+            self.assertEqual(len(pids), 3)
+            for _ in range(50):
+                if not any(process_alive(pid) for pid in pids):
+                    break
+                time.sleep(0.1)
+            self.assertFalse(any(process_alive(pid) for pid in pids))
+        start = time.perf_counter()
+        pairs = create_new_pairs(edges, solver='crash', stats=stats, deadline=60, fallback='greedy')
+        self.assertLess(time.perf_counter() - start, 30)
+        self.assertEqual(stats['solver'], 'greedy')
+        self.assertFalse(stats['missed_deadline'])
+        self.assertIn('broken solver', stats['solver_error'])
+        self.assertEqual(pairs, create_new_pairs(edges, solver='greedy'))
+
+    def test_approximate_matching(self):
+        for _ in range(200):
+            edges = self.generate_graph(2, 60)
+            stats = dict()
+            pairs, weight = approximate_matching(edges, stats=stats)
+            weights = {(i, j): w for i, j, w in edges}
+            vertices = [v for pair in pairs for v in pair]
+            self.assertEqual(len(vertices), len(set(vertices)))
+            self.assertEqual(sum(weights[pair] for pair in pairs), weight)
+            self.assertGreaterEqual(weight, greedy(edges)[1])
+            self.assertGreaterEqual(weight, 2 / 3 * blossom_algorithm(edges)[1])
+            self.assertLessEqual(weight, stats['upper_bound'])
+            found = dict()
+            self.assertEqual(create_new_pairs(edges, solver='approximate', stats=found), pairs)
+            self.assertEqual(found['weight'], weight)
+            self.assertEqual(create_new_pairs(edges, solver='approximate', solver_options={'approximate': {'epsilon': 10}}),
+                             approximate_matching(edges, epsilon=10)[0])
+
     def generate_graph(self, l, r):
         n = random.randint(l, r)
         edges = []
@@ -71,3 +267,251 @@ class TestBlossomAlgorithm(unittest.TestCase):
         if cnt == 0:
             edges.append([0, 1, 100])
         return edges
+
+
+class TestGraphBuilder(unittest.TestCase):
+    majors = ['Computer Science', 'computer science!', 'Computer Sciense', 'Mathematics', 'Math', 'Physics']
+    countries = ['Germany', 'germany', 'Germani', 'France', 'Spain', 'Italy']
+    interests = ['music', 'musics', 'sports', 'sport', 'books', 'travel', 'chess', 'cheese', 'hiking']
+    descriptions = ['I love programming and hiking.', 'I love programing and hiking', 'A math enthusiast and traveler.',
+                    'Just a student', 'Just a student!!', '',
+                    'Second year student who loves board games, jazz and long walks',
+                    'Second year student, loves board games, jazz and long walks in the park',
+                    'First year student who loves video games, rock and long walks']
+
+    def test_scoring_engine_matches_reference(self):
+        for _ in range(20):
+            users, users_id, users_info = self.generate_users(random.randint(1, 40))
+            history = self.generate_history(users, users_id)
+            self.assertEqual(build_initial_graph(users, users_id, users_info, history).tolist(),
+                             build_initial_graph_reference(users, users_id, users_info, history))
+
+    def test_candidates_keep_every_close_pair(self):
+        for _ in range(20):
+            users, users_id, users_info = self.generate_users(random.randint(1, 40))
+            src, dst = candidate_pairs(ProfileEncoding([users_info[user] for user in users]))
+            pairs = set(zip(src.tolist(), dst.tolist()))
+            for i, user1 in enumerate(users):
+                for j, user2 in enumerate(users):
+                    if i != j and are_close(users_info[user1], users_info[user2]):
+                        self.assertIn((i, j), pairs)
+
+    def test_parallel_scoring_matches_single_process(self):
+        users, users_id, users_info = self.generate_users(150)
+        history = self.generate_history(users, users_id)
+        self.assertEqual(build_initial_graph(users, users_id, users_info, history, workers=3).tolist(),
+                         build_initial_graph(users, users_id, users_info, history).tolist())
+
+    def test_edge_store_rescores_only_changed_users(self):
+        users, users_id, users_info = self.generate_users(60)
+        with tempfile.TemporaryDirectory() as directory:
+            store = EdgeStore(os.path.join(directory, 'edges.npz'))
+            build_initial_graph(users, users_id, users_info, HistoryIndex(users_id, []), store=store)
+            self.assertEqual(store.rescored, 60)
+            new_users, new_users_id, new_users_info = self.generate_users(64)
+            # Users 0-49 keep their profiles, 50-59 change and 60-63 are new
+            for user in users[:50]:
+                new_users_info[user] = users_info[user]
+            del new_users[5]
+            new_users_id = {user: i for i, user in enumerate(new_users)}
+            history = self.generate_history(new_users, new_users_id)
+            self.assertEqual(build_initial_graph(new_users, new_users_id, new_users_info, history, store=store).tolist(),
+                             build_initial_graph(new_users, new_users_id, new_users_info, history).tolist())
+            self.assertLessEqual(store.rescored, 14)
+
+    def test_distance_cache_persists_between_runs(self):
+        users, users_id, users_info = self.generate_users(30)
+        history = HistoryIndex(users_id, [])
+        expected = build_initial_graph_reference(users, users_id, users_info, history)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.sqlite')
+            for run in range(2):
+                cache = DistanceCache(path)
+                resolve_interests(users_info.values(), cache)
+                self.assertEqual(build_initial_graph(users, users_id, users_info, history, cache).tolist(), expected)
+                cache.close()
+                stats = cache.stats()
+                if run == 0:
+                    self.assertGreater(stats['misses'], 0)
+                else:
+                    self.assertEqual(stats['misses'], 0)
+                    self.assertEqual(stats['hit_rate'], 1.0)
+
+    def test_deletion_index(self):
+        vocabulary = list({''.join(random.choice('abc') for _ in range(random.randint(0, 8))) for _ in range(100)})
+        index = DeletionIndex(vocabulary, 3)
+        for value in vocabulary + ['abcabcab', '']:
+            self.assertEqual(index.lookup(value), {other for other in vocabulary if levenshtein_distance(value, other) <= 3})
+
+    def test_bounded_levenshtein(self):
+        for _ in range(2000):
+            s1 = ''.join(random.choice('abc') for _ in range(random.randint(0, 12)))
+            s2 = ''.join(random.choice('abc') for _ in range(random.randint(0, 12)))
+            bound = random.randint(0, 10)
+            self.assertEqual(bounded_levenshtein(s1, s2, bound), min(levenshtein_distance(s1, s2), bound + 1))
+
+    def test_history_stage(self):
+        users = ['100', '101', '102', '103']
+        interests = ['chess', 'piano', 'surfing', 'knitting']
+        users_data = [Document(user, {'is_active': True, 'interests': [interest]}) for user, interest in zip(users, interests)]
+        history_data = [Document('week', {'match_pairs': [
+            {'user1_id': users[0], 'user2_id': users[1], 'user1_isLike': 1, 'user2_isLike': 1, 'meeting_happened': True},
+            {'user1_id': users[0], 'user2_id': users[2], 'user1_isLike': 1, 'user2_isLike': 1, 'meeting_happened': True},
+            {'user1_id': users[3], 'user2_id': 'inactive', 'user1_isLike': 1, 'user2_isLike': 1, 'meeting_happened': True},
+        ]})]
+        # The history is a stream, so it can only be read once
+        graph, users_ind = build_graph(users_data, iter(history_data))
+        self.assertEqual(users_ind, users)
+        self.assertEqual(graph.tolist(), [[1, 2, 0], [2, 1, 0]])
+
+    def test_history_rollup(self):
+        users, users_id, users_info = self.generate_users(30)
+        weeks = [self.generate_history_documents(users + ['gone'])[0] for _ in range(3)]
+        for week, document in enumerate(weeks):
+            document.data['timestamp'] = week
+        expected = HistoryIndex(users_id, weeks)
+        rollup = HistoryRollup()
+        rollup.merge(weeks[:2])
+        stored = HistoryRollup(rollup.users, rollup.watermark)
+        self.assertEqual(stored.watermark, 1)
+        # The last week is still open, merging it twice is the same as once
+        stored = HistoryRollup(stored.users, stored.watermark, open_since=2)
+        stored.merge(weeks[2:])
+        stored.merge(weeks[2:])
+        self.assertEqual(stored.watermark, 1)
+        self.assertLessEqual(stored.changed, set(users + ['gone']))
+        history = HistoryIndex(users_id, stored)
+        self.assertEqual(history.met.tolist(), expected.met.tolist())
+        self.assertEqual(history.happened.tolist(), expected.happened.tolist())
+        self.assertEqual(history.neighbours.tolist(), expected.neighbours.tolist())
+        self.assertEqual(history.starts.tolist(), expected.starts.tolist())
+
+    def test_snapshot_replay(self):
+        users_data = [
+            Document(str(100 + i), {
+                'major': random.choice(self.majors),
+                'country': random.choice(self.countries),
+                'interests': random.sample(self.interests, random.randint(0, 4)),
+                'is_active': True,
+            })
+            for i in range(40)
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            stats = dict()
+            graph, users_ind = build_graph(users_data, [], stats=stats)
+            paths = [save_run(graph, users_ind, stats['profile_hashes'], directory, keep=2) for _ in range(3)]
+            self.assertEqual(len(set(paths)), 3)
+            self.assertEqual(sorted(os.listdir(directory)), [os.path.basename(path) for path in paths[1:]])
+            path = paths[-1]
+            loaded, loaded_ind, profile_hashes = load_snapshot(path)
+            self.assertEqual(loaded.tolist(), graph.tolist())
+            self.assertEqual(loaded.adjacency()[1].tolist(), EdgeList(graph.src, graph.dst, graph.weight).adjacency()[1].tolist())
+            self.assertEqual(loaded_ind.tolist(), users_ind)
+            self.assertEqual(len(profile_hashes), len(users_ind))
+            pairs, elapsed = replay(path)
+            self.assertEqual(pairs, [(users_ind[i], users_ind[j]) for i, j in create_new_pairs(graph)])
+
+    def generate_history(self, users, users_id):
+        return HistoryIndex(users_id, self.generate_history_documents(users))
+
+    def generate_history_documents(self, users):
+        pairs = [
+            {
+                'user1_id': random.choice(users),
+                'user2_id': random.choice(users),
+                'user1_isLike': random.choice([None, -1, 1]),
+                'user2_isLike': random.choice([None, -1, 1]),
+                'meeting_happened': random.choice([None, False, True]),
+            }
+            for _ in range(len(users) * 3)
+        ]
+        return [Document('week', {'match_pairs': pairs})]
+
+    def generate_users(self, n):
+        users = [str(100 + i) for i in range(n)]
+        users_id = {user: i for i, user in enumerate(users)}
+        users_info = {
+            user: make_profile({
+                'tg_id': user,
+                'full_name': 'Name ' + user,
+                'major': random.choice(self.majors),
+                'degree': random.choice(['Bachelor', 'Masters', 'PhD']),
+                'year': random.choice(['1', '2', '3']),
+                'country': random.choice(self.countries),
+                'interests': random.sample(self.interests, random.randint(0, 4)),
+                'description': random.choice(self.descriptions),
+                'is_active': True,
+            })
+            for user in users
+        }
+        resolve_interests(users_info.values())
+        return users, users_id, users_info
+
+
+class TestPipeline(unittest.TestCase):
+    def test_make_pairs_in_memory(self):
+        users = {
+            str(100 + i): {
+                'tg_id': str(100 + i),
+                'full_name': 'Name',
+                'photo': 'photo',
+                'major': random.choice(TestGraphBuilder.majors),
+                'country': random.choice(TestGraphBuilder.countries),
+                'interests': random.sample(TestGraphBuilder.interests, random.randint(0, 4)),
+                'is_active': i % 10 != 0,
+            }
+            for i in range(60)
+        }
+        repository = MemoryRepository(users, page_size=20)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        snapshots = os.path.join(directory.name, 'snapshots')
+        for week in range(2):
+            make_pairs(repository, os.path.join(directory.name, 'cache.sqlite'), os.path.join(directory.name, 'edges.npz'),
+                       snapshots)
+            self.assertEqual(len(os.listdir(snapshots)), week + 1)
+            self.assertTrue(repository.config['send'])
+            self.assertEqual(len(repository.history), week + 1)
+            pairs = [(pair['user1_id'], pair['user2_id']) for pair in repository.history_pairs[-1].values()]
+            self.assertEqual(repository.history[-1]['pairs_count'], len(pairs))
+            matched = [user for pair in pairs for user in pair]
+            self.assertEqual(len(matched), len(set(matched)))
+            self.assertTrue(all(users[user]['is_active'] for user in matched))
+            self.assertEqual(repository.history[-1]['matching']['solver'], 'blossom')
+        # Both weeks can still get feedback, so the watermark stays before them
+        self.assertIsNone(repository.watermark)
+        self.assertEqual(set(repository.rollup), {user for pairs in repository.history_pairs for pair in pairs.values()
+                                                  for user in (pair['user1_id'], pair['user2_id'])})
+        # Feedback given after the second run still reaches the rollup
+        pair = next(iter(repository.history_pairs[0].values()))
+        pair['meeting_happened'] = True
+        rollup = repository.get_history()
+        self.assertIn(pair['user2_id'], rollup.users[pair['user1_id']]['happened'])
+        self.assertIn(pair['user2_id'], repository.rollup[pair['user1_id']]['happened'])
+        # Once the feedback window is over the watermark moves past the week
+        repository.history[0]['timestamp'] -= datetime.timedelta(days=FEEDBACK_DAYS + 1)
+        repository.get_history()
+        self.assertEqual(repository.watermark, repository.history[0]['timestamp'])
+
+    def test_scaling_run(self):
+        repository = synthetic_repository(80, weeks=3, seed=1)
+        self.assertEqual(repository.users, synthetic_repository(80, weeks=3, seed=1).users)
+        self.assertEqual(len(repository.history_pairs), 3)
+        self.assertTrue(all(len(pairs) == 40 for pairs in repository.history_pairs))
+        result = json.loads(json.dumps(scaling_run(80, weeks=3, seed=1)))
+        self.assertEqual(result['active'], sum(user['is_active'] for user in repository.users.values()))
+        self.assertTrue(all(result[stage]['seconds'] >= 0 for stage in STAGES))
+        self.assertEqual(result['write']['requests'], 2)
+
+    def test_week_batches(self):
+        pairs = [(str(2 * i), str(2 * i + 1)) for i in range(1200)]
+        batches = week_batches(pairs, batch_size=500)
+        self.assertEqual([len(batch) for batch in batches], [500, 500, 201])
+        self.assertEqual(batches[0][0], (None, {'timestamp': None, 'pairs_count': 1200}))
+        ids = [id for batch in batches for id, _ in batch]
+        self.assertEqual(len(set(ids[1:])), len(pairs))
+        repository = MemoryRepository()
+        repository.update(pairs[:10])
+        # One batch with the week and its pairs, then the send flag
+        self.assertEqual(repository.requests, 2)
+        self.assertEqual(repository.history_pairs[0]['0_1']['user2_id'], '1')
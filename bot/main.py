@@ -13,6 +13,7 @@ from aiogram.fsm.state import State, StatesGroup
 from datetime import datetime, timedelta
 from pytz import timezone
 from dotenv import load_dotenv
+from profile_cache import ProfileCache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -104,34 +105,72 @@ def update_db(user_id, data):
     try:
         user_ref = db.collection('users').document(str(user_id))
         user_ref.set(data, merge=True)
+        profile_cache.update(user_id, data)
         logger.info(f"Updated Firestore for user {user_id}: {data}")
     except Exception as e:
+        profile_cache.invalidate(user_id)
         logger.error(f"Error updating Firestore: {e}")
 
 def delete_user_data(user_id):
     try:
         user_ref = db.collection('users').document(str(user_id))
         user_ref.delete()
+        profile_cache.delete(user_id)
         logger.info(f"Deleted user data for user {user_id}")
     except Exception as e:
+        profile_cache.invalidate(user_id)
         logger.error(f"Error deleting user data: {e}")
 
-def get_user_data(user_id):
+def read_user_data(user_id):
+    user_ref = db.collection('users').document(str(user_id))
+    user_doc = user_ref.get()
+    if user_doc.exists:
+        return user_doc.to_dict()
+    else:
+        return None
+
+profile_cache = ProfileCache(read_user_data)
+
+async def get_user_data(user_id):
     try:
-        user_ref = db.collection('users').document(str(user_id))
-        user_doc = user_ref.get()
-        if user_doc.exists:
-            return user_doc.to_dict()
-        else:
-            return None
+        return await profile_cache.get(user_id)
     except Exception as e:
         logger.error(f"Error retrieving user data: {e}")
         return None
 
+def get_latest_pairs():
+    history_ref = db.collection('history').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(1)
+    latest_history = next(history_ref.stream(), None)
+    if latest_history is None:
+        return None, []
+    legacy_pairs = latest_history.to_dict().get('match_pairs')
+    if legacy_pairs is not None:
+        return latest_history.id, legacy_pairs
+    pairs = [pair.to_dict() for pair in latest_history.reference.collection('pairs').stream()]
+    return latest_history.id, pairs
+
+def update_pair(history_id, user_id, match_id, get_fields):
+    history_ref = db.collection('history').document(history_id)
+    pairs_ref = history_ref.collection('pairs')
+    for pair_id in (f"{user_id}_{match_id}", f"{match_id}_{user_id}"):
+        pair_doc = pairs_ref.document(pair_id).get()
+        if pair_doc.exists:
+            pair_doc.reference.update(get_fields(pair_doc.to_dict()))
+            return True
+    history_doc = history_ref.get()
+    if history_doc.exists:
+        match_pairs = history_doc.to_dict().get('match_pairs', [])
+        for pair in match_pairs:
+            if {pair['user1_id'], pair['user2_id']} == {user_id, match_id}:
+                pair.update(get_fields(pair))
+                history_ref.update({'match_pairs': match_pairs})
+                return True
+    return False
+
 @dp.message(Command(commands=['start']))
 async def start(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
-    user_data = get_user_data(user_id)
+    user_data = await get_user_data(user_id)
     if user_data:
         await state.set_state(UserForm.menu)
         await message.answer("👋 Welcome back!")
@@ -275,7 +314,7 @@ async def change_info(callback_query: types.CallbackQuery, state: FSMContext):
 @dp.callback_query(F.data == 'my_profile')
 async def my_profile(callback_query: types.CallbackQuery, state: FSMContext):
     user_id = callback_query.from_user.id
-    user_data = get_user_data(user_id)
+    user_data = await get_user_data(user_id)
     if user_data:
         likes_formatted = ', '.join(user_data.get('interests', []))
         user_info = (
@@ -403,7 +442,7 @@ async def resume_matching(callback_query: types.CallbackQuery, state: FSMContext
 
 async def open_menu(message_or_query, state: FSMContext):
     user_id = message_or_query.from_user.id
-    user_data = get_user_data(user_id)
+    user_data = await get_user_data(user_id)
     is_active = user_data.get('is_active', True) if user_data else True
     menu_text = "🔸 <b>Main Menu</b> 🔸"
     menu_keyboard = get_menu_keyboard(is_active)
@@ -419,7 +458,7 @@ async def handle_unrecognized_message(message: types.Message, state: FSMContext)
     current_state = await state.get_state()
 
     if current_state is None:
-        user_data = get_user_data(user_id)
+        user_data = await get_user_data(user_id)
         if user_data:
             await state.set_state(UserForm.menu)
             await message.answer("👋 Welcome back!")
@@ -439,15 +478,13 @@ async def handle_unrecognized_message(message: types.Message, state: FSMContext)
 
 async def send_match_notifications():
     try:
-        history_ref = db.collection('history').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(1)
-        latest_history = next(history_ref.stream(), None)
+        _, match_pairs = get_latest_pairs()
 
-        if latest_history:
-            history_data = latest_history.to_dict()
-            match_pairs = history_data.get('match_pairs', [])
+        if match_pairs:
             for pair in match_pairs:
                 await send_match_notification(pair['user1_id'], pair['user2_id'])
                 await send_match_notification(pair['user2_id'], pair['user1_id'])
+            logger.info(f"Profile cache: {profile_cache.stats()}")
         else:
             logger.info("No match pairs found in the latest history.")
     except Exception as e:
@@ -455,7 +492,7 @@ async def send_match_notifications():
 
 async def send_match_notification(user_id, match_id):
     try:
-        match_data = get_user_data(match_id)
+        match_data = await get_user_data(match_id)
         if not match_data:
             logger.error(f"User data not found for user {match_id}")
             return
@@ -504,12 +541,9 @@ async def collect_feedback():
         await asyncio.sleep(time_until_next_run)
 
         try:
-            history_ref = db.collection('history').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(1)
-            latest_history = next(history_ref.stream(), None)
+            history_id, match_pairs = get_latest_pairs()
 
-            if latest_history:
-                history_id = latest_history.id
-                match_pairs = latest_history.to_dict().get('match_pairs', [])
+            if match_pairs:
                 for pair in match_pairs:
                     await send_feedback_request(pair['user1_id'], pair['user2_id'], history_id)
                     await send_feedback_request(pair['user2_id'], pair['user1_id'], history_id)
@@ -544,18 +578,7 @@ async def handle_meeting_feedback(callback_query: types.CallbackQuery, state: FS
     match_id = data_parts[3]
     user_id = str(callback_query.from_user.id)
 
-    history_ref = db.collection('history').document(history_id)
-    history_doc = history_ref.get()
-    if history_doc.exists:
-        match_pairs = history_doc.to_dict().get('match_pairs', [])
-        for pair in match_pairs:
-            if pair['user1_id'] == user_id and pair['user2_id'] == match_id:
-                pair['meeting_happened'] = True if response == 'yes' else False
-                break
-            elif pair['user2_id'] == user_id and pair['user1_id'] == match_id:
-                pair['meeting_happened'] = True if response == 'yes' else False
-                break
-        history_ref.update({'match_pairs': match_pairs})
+    if update_pair(history_id, user_id, match_id, lambda pair: {'meeting_happened': response == 'yes'}):
 
         if response == 'yes':
             await callback_query.message.edit_text("Great! Did you enjoy the meeting?")
@@ -584,18 +607,10 @@ async def handle_feedback_response(message: types.Message, state: FSMContext):
         await message.reply("Please respond with 'Yes' or 'No'.")
         return
 
-    history_ref = db.collection('history').document(history_id)
-    history_doc = history_ref.get()
-    if history_doc.exists:
-        match_pairs = history_doc.to_dict().get('match_pairs', [])
-        for pair in match_pairs:
-            if pair['user1_id'] == user_id and pair['user2_id'] == match_id:
-                pair['user1_isLike'] = feedback_value
-                break
-            elif pair['user2_id'] == user_id and pair['user1_id'] == match_id:
-                pair['user2_isLike'] = feedback_value
-                break
-        history_ref.update({'match_pairs': match_pairs})
+    def get_like_field(pair):
+        return {'user1_isLike' if pair['user1_id'] == user_id else 'user2_isLike': feedback_value}
+
+    if update_pair(history_id, user_id, match_id, get_like_field):
         next_monday = get_next_monday()
 
         if feedback_value == 1:
@@ -0,0 +1,89 @@
+import asyncio
+import copy
+import time
+from collections import OrderedDict
+
+# Seconds a profile is kept, it only goes stale when it is changed outside of the bot
+PROFILE_TTL = 10 * 60
+MAX_PROFILES = 10000
+
+
+# Profiles by user id, kept for ttl seconds and at most max_size of them, the least recently used go first
+# load(user_id) is the blocking firestore read of one profile (None if there is no such user), it runs in a thread
+# so the event loop is not blocked, and concurrent misses for the same user share one read (reads counts them)
+# The bot writes through update and delete, so the cache stays current for everything the bot changes itself
+class ProfileCache:
+    def __init__(self, load, ttl=PROFILE_TTL, max_size=MAX_PROFILES):
+        self.load = load
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.reads = 0
+        self.evictions = 0
+
+    async def get(self, user_id):
+        user_id = str(user_id)
+        entry = self.entries.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+        self.misses += 1
+        task = self.loading.get(user_id)
+        if task is None:
+            self.reads += 1
+            task = asyncio.ensure_future(asyncio.to_thread(self.load, user_id))
+            self.loading[user_id] = task
+        try:
+            data = await asyncio.shield(task)
+        finally:
+            if self.loading.get(user_id) is task and task.done():
+                del self.loading[user_id]
+                if not task.cancelled() and task.exception() is None:
+                    self.put(user_id, task.result())
+        return copy.deepcopy(data)
+
+    def put(self, user_id, data):
+        self.entries[user_id] = (time.monotonic() + self.ttl, copy.deepcopy(data))
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    # A merge write of data: a cached profile is updated in place, a cached missing user becomes data,
+    # a profile that is not cached stays out since the rest of its fields are unknown,
+    # and an expired one is dropped, the other fields may have changed outside of the bot since it was read
+    def update(self, user_id, data):
+        user_id = str(user_id)
+        self.loading.pop(user_id, None)
+        entry = self.entries.get(user_id)
+        if entry is None or entry[0] <= time.monotonic():
+            self.entries.pop(user_id, None)
+            return
+        profile = copy.deepcopy(entry[1]) if entry[1] is not None else {}
+        profile.update(copy.deepcopy(data))
+        self.put(user_id, profile)
+
+    def delete(self, user_id):
+        user_id = str(user_id)
+        self.loading.pop(user_id, None)
+        self.put(user_id, None)
+
+    def invalidate(self, user_id):
+        user_id = str(user_id)
+        self.loading.pop(user_id, None)
+        self.entries.pop(user_id, None)
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'reads': self.reads,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'size': len(self.entries),
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+from profile_cache import ProfileCache
+
+
+# Blocking profile read over a dict of profiles that counts its calls, like the firestore read of the bot
+class Database:
+    def __init__(self, profiles, delay=0):
+        self.profiles = profiles
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def load(self, user_id):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.profiles.get(user_id) == 'broken':
+            raise ConnectionError('firestore is down')
+        return self.profiles.get(user_id)
+
+
+class TestProfileCache(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('profile_cache.time', mock.Mock(monotonic=lambda: self.now))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_ttl_expiry(self):
+        database = Database({'1': {'major': 'Math'}})
+        cache = ProfileCache(database.load, ttl=60)
+        self.assertEqual(asyncio.run(cache.get(1)), {'major': 'Math'})
+        database.profiles['1'] = {'major': 'Physics'}
+        self.now += 59
+        self.assertEqual(asyncio.run(cache.get(1)), {'major': 'Math'})
+        self.now += 1
+        self.assertEqual(asyncio.run(cache.get(1)), {'major': 'Physics'})
+        self.assertEqual(database.calls, 2)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_update_of_expired_profile(self):
+        database = Database({'1': {'major': 'Math', 'year': '1'}})
+        cache = ProfileCache(database.load, ttl=60)
+        asyncio.run(cache.get('1'))
+        database.profiles['1'] = {'major': 'Physics', 'year': '2'}
+        self.now += 60
+        cache.update('1', {'year': '3'})
+        self.assertEqual(cache.stats()['size'], 0)
+        database.profiles['1']['year'] = '3'
+        self.assertEqual(asyncio.run(cache.get('1')), {'major': 'Physics', 'year': '3'})
+        self.assertEqual(database.calls, 2)
+
+    def test_lru_eviction(self):
+        database = Database({str(i): {'id': i} for i in range(3)})
+        cache = ProfileCache(database.load, max_size=2)
+        asyncio.run(cache.get('0'))
+        asyncio.run(cache.get('1'))
+        asyncio.run(cache.get('0'))
+        asyncio.run(cache.get('2'))
+        self.assertEqual(list(cache.entries), ['0', '2'])
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(asyncio.run(cache.get('1')), {'id': 1})
+        self.assertEqual(database.calls, 4)
+        self.assertEqual(list(cache.entries), ['2', '1'])
+
+    def test_write_through(self):
+        database = Database({'1': {'major': 'Math', 'year': '1'}})
+        cache = ProfileCache(database.load)
+        profile = asyncio.run(cache.get('1'))
+        profile['year'] = '4'
+        cache.update(1, {'year': '2'})
+        self.assertEqual(asyncio.run(cache.get('1')), {'major': 'Math', 'year': '2'})
+        cache.delete('1')
+        self.assertIsNone(asyncio.run(cache.get('1')))
+        cache.update('1', {'major': 'Law'})
+        self.assertEqual(asyncio.run(cache.get('1')), {'major': 'Law'})
+        # A profile that is not cached is only written to the database, the next get reads it
+        cache.update('2', {'major': 'Law'})
+        self.assertEqual(cache.stats()['size'], 1)
+        self.assertEqual(database.calls, 1)
+
+    def test_invalidate_on_failure(self):
+        database = Database({'1': 'broken', '2': {'major': 'Math'}})
+        cache = ProfileCache(database.load)
+        with self.assertRaises(ConnectionError):
+            asyncio.run(cache.get('1'))
+        self.assertEqual(cache.stats()['size'], 0)
+        database.profiles['1'] = {'major': 'Law'}
+        self.assertEqual(asyncio.run(cache.get('1')), {'major': 'Law'})
+        # A write that failed leaves the database unknown, so the bot invalidates the profile
+        asyncio.run(cache.get('2'))
+        cache.invalidate('2')
+        self.assertEqual(asyncio.run(cache.get('2')), {'major': 'Math'})
+        self.assertEqual(database.calls, 4)
+
+    def test_concurrent_misses(self):
+        database = Database({'1': {'interests': ['chess']}}, delay=0.05)
+        cache = ProfileCache(database.load)
+
+        async def get_all():
+            return await asyncio.gather(*(cache.get('1') for _ in range(5)))
+
+        profiles = asyncio.run(get_all())
+        self.assertEqual(database.calls, 1)
+        self.assertEqual(cache.stats()['reads'], 1)
+        self.assertEqual(cache.stats()['misses'], 5)
+        self.assertTrue(all(profile == {'interests': ['chess']} for profile in profiles))
+        profiles[0]['interests'].append('music')
+        self.assertEqual(profiles[1], {'interests': ['chess']})
+        self.assertEqual(asyncio.run(cache.get('1')), {'interests': ['chess']})
+
+
+if __name__ == '__main__':
+    unittest.main()